@@ -0,0 +1,360 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import math
+import random
+import statistics
+import sys
+import time
+
+from MicroserviceContainer import MicroserviceContainer
+from Scenario import Scenario, resolve
+
+
+class DecisionService:
+    """
+        Serves orchestrator decisions for cloud state snapshots over newline-delimited JSON
+
+        Request:
+        {
+            "id": 1,
+            "cloud_id": "checkout",
+            "t": 12.5,
+            "provider": {"type": "SpotMarketProvider1"},
+            "orchestrator": {"type": "spot_market", "delta": 0.01},
+            "microservices": [
+                {"name": "db", "cost": 0.05, "failure_model": "exponential",
+                 "containers": [{"name": "db-1", "age": 0.4}, {"name": "db-2", "age": 1.2, "state": 1}]}
+            ]
+        }
+
+        Response:
+        {"id": 1, "cloud_id": "checkout", "spawn": {"db": 1}, "remove": {"db": ["db-2"]}, "containers": {"db": 2},
+         "expected_cost_of_failure": 0.0012}
+        An orchestrator in anytime mode ({"type": "spot_market", "delta": 0.01, "time_budget": 0.001}) also reports
+        whether the decision was cut short, as "deadline_hit"; see deadline_statistics for its latency percentiles.
+
+        provider and orchestrator take the same form as in a Scenario and default to a constant spot market and a
+        SpotMarketOrchestrator with delta 0.01. The orchestrator and microservices of each cloud_id are kept warm
+        between requests (for the max_clouds most recently used cloud_ids), and concurrent requests are decided in
+        batches on a single worker thread.
+    """
+    DEFAULT_PROVIDER = {"type": "constant"}
+    DEFAULT_ORCHESTRATOR = {"type": "spot_market", "delta": 0.01}
+
+    def __init__(self, max_batch=64, batch_delay=0.0, max_clouds=1024):
+        """
+            Creates a new decision service
+            max_batch - the largest number of requests decided together
+            batch_delay - how long (seconds) to wait for more requests before deciding a batch
+            max_clouds - the number of cloud_ids kept warm, the least recently used are evicted
+        """
+        self._max_batch = max_batch
+        self._batch_delay = batch_delay
+        self._max_clouds = max_clouds
+        self._clouds = collections.OrderedDict()  # cloud_id => warm state (see _cloud_state), least recently used first
+        self._queue = None
+        self._batcher_task = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.requests = 0
+        self.batches = 0
+
+    def _cloud_state(self, request):
+        """
+            Returns the warm state for the request's cloud, rebuilding the orchestrator if its configuration changed
+        """
+        cloud_id = request.get("cloud_id", "default")
+        provider_config = request.get("provider", DecisionService.DEFAULT_PROVIDER)
+        orchestrator_config = request.get("orchestrator", DecisionService.DEFAULT_ORCHESTRATOR)
+        config_key = json.dumps([provider_config, orchestrator_config], sort_keys=True)
+
+        state = self._clouds.get(cloud_id)
+        if state is not None:
+            self._clouds.move_to_end(cloud_id)
+        if state is None or state["config_key"] != config_key:
+            provider_params = dict(provider_config)
+            provider = resolve(provider_params.pop("type"), Scenario.PROVIDER_TYPES)(**provider_params)
+            orchestrator_params = dict(orchestrator_config)
+            orchestrator_cls = resolve(orchestrator_params.pop("type"), Scenario.ORCHESTRATOR_TYPES)
+            orchestrator = orchestrator_cls(orchestrator_delta=orchestrator_params.pop("delta"), spot_market_provider=provider,
+                                            **orchestrator_params)
+            state = self._clouds[cloud_id] = {
+                "config_key": config_key,
+                "orchestrator": orchestrator,
+                "microservices": {},  # (name, failure model) => Microservice
+                "cloud": resolve("Cloud:Cloud", {})([]),
+            }
+            while len(self._clouds) > self._max_clouds:
+                self._clouds.popitem(last=False)
+        return state
+
+    def _load_snapshot(self, state, request, t):
+        """
+            Updates the warm cloud in place to match the snapshot in the request
+        """
+        microservices = []
+        warm = {}
+        for snapshot in request["microservices"]:
+            failure_model = snapshot.get("failure_model", "exponential")
+            microservice = state["microservices"].get((snapshot["name"], failure_model))
+            if microservice is None:
+                cls = resolve(failure_model, Scenario.MICROSERVICE_TYPES)
+                microservice = cls(cost=snapshot["cost"], name=snapshot["name"])
+            warm[(snapshot["name"], failure_model)] = microservice
+            microservice.cost = snapshot["cost"]
+
+            # Containers are named by the client so that the removed ones can be reported back to it
+            for container in snapshot.get("containers", []):
+                if container.get("name") is None:
+                    raise ValueError(f"a container of microservice '{snapshot['name']}' has no name")
+
+            # Only the failure function matters for decisions, so the sampled failure time is never reached
+            microservice.containers = []
+            for container in snapshot.get("containers", []):
+                c = MicroserviceContainer(microservice.failure_function, local_failure_time=math.inf, t0=t - container["age"],
+                                          name=container.get("name"))
+                c.state = container.get("state", MicroserviceContainer.STATE_ACTIVE)
+                microservice.containers.append(c)
+            microservice.count_active_containers()
+            microservices.append(microservice)
+
+        # Only the microservices of the latest snapshot are kept warm
+        state["microservices"] = warm
+        state["cloud"].microservices = microservices
+        return state["cloud"]
+
+    def decide(self, request):
+        """
+            Returns the orchestrator's decision for a single request
+        """
+        try:
+            t = request["t"]
+            state = self._cloud_state(request)
+            cloud = self._load_snapshot(state, request, t)
+            before = [list(microservice.containers) for microservice in cloud.microservices]
+
+            orchestrator = state["orchestrator"]
+            deadline_hits = getattr(orchestrator, "deadline_hits", 0)
+            orchestrator.orchestrate(cloud, t)
+
+            spawn = {}
+            remove = {}
+            containers = {}
+            for microservice, containers_before in zip(cloud.microservices, before):
+                # Containers are compared by identity, since the names of spawned containers are random
+                retained = set(id(c) for c in containers_before) & set(id(c) for c in microservice.containers)
+                spawned = len(microservice.containers) - len(retained)
+                removed = sorted(c.name for c in containers_before if id(c) not in retained)
+                if spawned > 0:
+                    spawn[microservice.name] = spawned
+                if len(removed) > 0:
+                    remove[microservice.name] = removed
+                containers[microservice.name] = len(microservice.containers)
+
+            response = {
+                "id": request.get("id"),
+                "cloud_id": request.get("cloud_id", "default"),
+                "spawn": spawn,
+                "remove": remove,
+                "containers": containers,
+                "expected_cost_of_failure": orchestrator.expected_cost_of_failure(t, orchestrator.orchestrator_delta, cloud),
+            }
+            if getattr(orchestrator, "time_budget", None) is not None:
+                response["deadline_hit"] = orchestrator.deadline_hits > deadline_hits
+            return response
+        except Exception as e:
+            # A bad snapshot (e.g. a container so old that its failure function rounds to 1) only fails its own request
+            return {"id": request.get("id") if isinstance(request, dict) else None, "error": f"{e.__class__.__name__}: {e}"}
+
+    def deadline_statistics(self):
+        """
+            Returns cloud_id => the deadline statistics (see SpotMarketOrchestrator.deadline_statistics) of every warm
+            orchestrator in anytime mode
+        """
+        return {cloud_id: state["orchestrator"].deadline_statistics() for cloud_id, state in list(self._clouds.items())
+                if getattr(state["orchestrator"], "time_budget", None) is not None}
+
+    def decide_batch(self, requests):
+        """
+            Decides a batch of requests, deciding identical snapshots of the same cloud only once
+        """
+        self.batches += 1
+        self.requests += len(requests)
+
+        decisions = {}
+        responses = []
+        for request in requests:
+            if not isinstance(request, dict):
+                responses.append({"id": None, "error": "request must be a JSON object"})
+                continue
+            key = json.dumps({k: v for k, v in request.items() if k != "id"}, sort_keys=True)
+            decision = decisions.get(key)
+            if decision is None:
+                decision = decisions[key] = self.decide(request)
+            responses.append(dict(decision, id=request.get("id")))
+        return responses
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            if self._batch_delay > 0:
+                await asyncio.sleep(self._batch_delay)
+            while len(batch) < self._max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                responses = await loop.run_in_executor(self._executor, self.decide_batch, [request for request, future in batch])
+            except Exception as e:
+                responses = [{"id": request.get("id") if isinstance(request, dict) else None, "error": f"{e.__class__.__name__}: {e}"}
+                             for request, future in batch]
+            for (request, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+
+    async def _handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    response = {"id": None, "error": f"invalid JSON: {e}"}
+                else:
+                    future = loop.create_future()
+                    await self._queue.put((request, future))
+                    response = await future
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=0, unix_path=None):
+        """
+            Starts serving on a Unix socket (if unix_path is given) or on host:port
+            Returns the asyncio server
+        """
+        self._queue = asyncio.Queue()
+        self._batcher_task = asyncio.create_task(self._batcher())
+        if unix_path is not None:
+            return await asyncio.start_unix_server(self._handle_connection, path=unix_path)
+        return await asyncio.start_server(self._handle_connection, host=host, port=port)
+
+
+def random_request(rng, cloud_id, t, orchestrator=None):
+    """
+        Creates a random snapshot of a cloud for load generation
+        orchestrator - the orchestrator configuration of the request, defaults to the service's
+    """
+    microservices = []
+    for m in range(3):
+        containers = [{"name": f"{cloud_id}-{m}-{c}", "age": rng.uniform(0, 2), "state": int(rng.random() < 0.1)}
+                      for c in range(rng.randint(0, 4))]
+        microservices.append({"name": f"MS_{m}", "cost": 0.01 * (m + 1), "containers": containers})
+    request = {"cloud_id": cloud_id, "t": t, "provider": {"type": "SpotMarketProvider1"}, "microservices": microservices}
+    if orchestrator is not None:
+        request["orchestrator"] = orchestrator
+    return request
+
+
+async def generate_load(connect, clients=16, requests_per_client=100, clouds=8, seed=0, orchestrator=None):
+    """
+        Sends requests from concurrent clients and returns the list of decision latencies in seconds
+            connect - a coroutine function returning a (reader, writer) pair connected to the service
+            orchestrator - the orchestrator configuration of the requests, defaults to the service's
+    """
+    latencies = []
+
+    async def client(i):
+        rng = random.Random(seed + i)
+        reader, writer = await connect()
+        for n in range(requests_per_client):
+            request = random_request(rng, f"cloud-{rng.randrange(clouds)}", t=n * 0.01, orchestrator=orchestrator)
+            request["id"] = n
+            start = time.perf_counter()
+            writer.write(json.dumps(request).encode() + b"\n")
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start)
+            if "error" in response:
+                raise RuntimeError(response["error"])
+        writer.close()
+
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    return latencies
+
+
+async def benchmark(args):
+    service = None
+    if args.unix is not None and args.connect:
+        connect = lambda: asyncio.open_unix_connection(args.unix)
+    elif args.connect:
+        connect = lambda: asyncio.open_connection(args.host, args.port)
+    else:
+        # No running service to connect to, so benchmark one in this process
+        service = DecisionService(max_batch=args.max_batch, batch_delay=args.batch_delay, max_clouds=args.max_clouds)
+        server = await service.start(host="127.0.0.1", port=0)
+        port = server.sockets[0].getsockname()[1]
+        connect = lambda: asyncio.open_connection("127.0.0.1", port)
+
+    orchestrator = None
+    if args.time_budget is not None:
+        orchestrator = dict(DecisionService.DEFAULT_ORCHESTRATOR, time_budget=args.time_budget)
+
+    start = time.perf_counter()
+    latencies = await generate_load(connect, clients=args.clients, requests_per_client=args.requests, clouds=args.clouds,
+                                    orchestrator=orchestrator)
+    elapsed = time.perf_counter() - start
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(f"Requests: {len(latencies)} in {elapsed:.2f}s ({len(latencies) / elapsed:.0f}/s)")
+    print(f"Latency >> p50: {percentiles[49] * 1000:.2f}ms | p99: {percentiles[98] * 1000:.2f}ms | Max: {max(latencies) * 1000:.2f}ms")
+    if service is not None:
+        print(f"Batches: {service.batches} (mean size {service.requests / max(1, service.batches):.1f})")
+        deadlines = service.deadline_statistics().values()
+        if len(deadlines) > 0:
+            print(f"Orchestrator deadline >> Hit: {sum(d['deadline_hits'] for d in deadlines)}/{sum(d['runs'] for d in deadlines)} runs | "
+                  f"Worst cloud p50: {max(d['p50_latency'] for d in deadlines) * 1000:.3f}ms | "
+                  f"p99: {max(d['p99_latency'] for d in deadlines) * 1000:.3f}ms")
+
+
+async def serve(args):
+    service = DecisionService(max_batch=args.max_batch, batch_delay=args.batch_delay, max_clouds=args.max_clouds)
+    server = await service.start(host=args.host, port=args.port, unix_path=args.unix)
+    print(f"Serving orchestrator decisions on {args.unix or server.sockets[0].getsockname()}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves SpotMarketOrchestrator decisions for cloud state snapshots")
+    parser.add_argument("command", choices=["serve", "bench"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="serve on (or connect to) this Unix socket instead of TCP")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="seconds to wait for a batch to fill")
+    parser.add_argument("--max-clouds", type=int, default=1024, help="number of cloud_ids kept warm")
+    parser.add_argument("--connect", action="store_true", help="bench: connect to a running service instead of starting one")
+    parser.add_argument("--clients", type=int, default=16, help="bench: number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="bench: requests per client")
+    parser.add_argument("--clouds", type=int, default=8, help="bench: number of distinct clouds")
+    parser.add_argument("--time-budget", type=float, help="bench: run the orchestrators in anytime mode with this budget (seconds)")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    try:
+        asyncio.run(serve(args) if args.command == "serve" else benchmark(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
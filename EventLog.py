@@ -0,0 +1,281 @@
+import sys
+
+from MicroserviceContainer import MicroserviceContainer
+
+
+class EventLog:
+    """
+        A structured log of simulation events held in a preallocated ring buffer
+        Each event is a tuple of (kind, t, microservice index, name, value)
+        When the buffer is full the oldest events are overwritten, and folded into a snapshot of the cloud so that the
+        retained events can still be replayed without the declarations they overwrote
+        An orchestration traced in STYLE_SUMMARY that changed nothing prints nothing, so it is not recorded at all
+    """
+    MICROSERVICE = 0  # Declares a microservice; name is its label, value is unused
+    CONTAINER = 1  # Declares an existing container; value is its state
+    SPAWN = 2  # A redundant container was spawned by the orchestrator
+    SPAWN_RECOVERY = 3  # A container was spawned because the microservice had none left
+    REMOVE = 4  # An excess container was removed by the orchestrator
+    REMOVE_FAILED = 5  # A failed container was removed from the cloud
+    FAIL = 6  # A container failed; value is its local failure time
+    ORCHESTRATE_BEGIN = 7  # The orchestrator started deciding; value is the trace style
+    ORCHESTRATE_END = 8  # The orchestrator finished deciding
+
+    # Costs are totalled outside the ring buffer (see add_cost), so that they never push out the events above
+    COST_RUNNING = 9  # Running cost accrued by the cloud
+    COST_FAILURE = 10  # Cost of the cloud's failures
+
+    # Trace styles for ORCHESTRATE_BEGIN
+    STYLE_PER_CONTAINER = 0  # Every spawn and removal is printed on its own line
+    STYLE_SUMMARY = 1  # The cloud is printed before and after the orchestrator if it changed
+
+    def __init__(self, capacity=1 << 18):
+        """
+            Creates a new event log
+            capacity - the number of events retained before the oldest are overwritten
+        """
+        self._capacity = capacity
+        self._events = [None] * capacity
+        self._count = 0
+        self._snapshot = {}  # The cloud before the oldest retained event, see apply_event
+        self.costs = {EventLog.COST_RUNNING: 0, EventLog.COST_FAILURE: 0}  # Cost kind => total accrued
+        self._pending = None  # A STYLE_SUMMARY ORCHESTRATE_BEGIN, recorded only once an event follows it
+        self._open = None  # The overwritten ORCHESTRATE_BEGIN of the orchestration the oldest retained event is part of
+
+    def record(self, kind, t, microservice=-1, name=None, value=0.0):
+        """
+            Appends an event to the log
+            kind - one of the event kinds defined on EventLog
+            t - global time
+            microservice - the index into cloud.microservices, -1 if not applicable
+            name - the container name (or microservice label), None if not applicable
+            value - the numeric payload of the event
+        """
+        if kind == EventLog.ORCHESTRATE_BEGIN and value == EventLog.STYLE_SUMMARY:
+            self._pending = (kind, t, microservice, name, value)
+            return
+        if self._pending is not None:
+            pending = self._pending
+            self._pending = None
+            if kind == EventLog.ORCHESTRATE_END:
+                return
+            self._append(pending)
+        self._append((kind, t, microservice, name, value))
+
+    def _append(self, event):
+        i = self._count % self._capacity
+        if self._count >= self._capacity:
+            overwritten = self._events[i]
+            apply_event(self._snapshot, *overwritten)
+            if overwritten[0] == EventLog.ORCHESTRATE_BEGIN:
+                self._open = overwritten
+            elif overwritten[0] == EventLog.ORCHESTRATE_END:
+                self._open = None
+        self._events[i] = event
+        self._count += 1
+
+    def add_cost(self, kind, amount):
+        """
+            Adds an amount to the total of a cost kind (EventLog.COST_RUNNING or EventLog.COST_FAILURE)
+        """
+        self.costs[kind] += amount
+
+    def declare_cloud(self, cloud, t=0):
+        """
+            Records the current shape of the cloud so that the log can be replayed without it
+        """
+        for i, microservice in enumerate(cloud.microservices):
+            self.record(EventLog.MICROSERVICE, t, i, microservice.label())
+            for container in microservice.containers:
+                self.record(EventLog.CONTAINER, t, i, container.name, container.state)
+
+    def __len__(self):
+        """
+            Returns the number of events currently retained
+        """
+        return min(self._count, self._capacity)
+
+    @property
+    def dropped(self):
+        """
+            Returns the number of events that have been overwritten
+        """
+        return max(0, self._count - self._capacity)
+
+    def events(self, start=0):
+        """
+            Yields the retained events whose sequence number is at least start
+            If events from start on have been overwritten, they are replaced by declarations of the cloud before the
+            oldest retained event (and the beginning of the orchestration it is part of, if any)
+            start - the sequence number of the first event to yield
+        """
+        if start < self.dropped:
+            t = self._events[self._count % self._capacity][1]
+            for i in sorted(self._snapshot):
+                label, containers = self._snapshot[i]
+                yield (EventLog.MICROSERVICE, t, i, label, 0.0)
+                for name, state in containers:
+                    yield (EventLog.CONTAINER, t, i, name, state)
+            if self._open is not None:
+                yield self._open
+        for i in range(max(start, self.dropped), self._count):
+            yield self._events[i % self._capacity]
+
+    @property
+    def position(self):
+        """
+            Returns the sequence number that will be assigned to the next event
+        """
+        return self._count
+
+    def save(self, path):
+        """
+            Writes the retained events to a compact binary file (numpy .npz)
+        """
+        # Only needed when persisting a trace, so keep numpy off the tracing path
+        import numpy
+
+        names = []
+        name_indices = {}
+        events = list(self.events())
+        records = numpy.zeros(len(events), dtype=[("kind", numpy.uint8), ("t", numpy.float64), ("microservice", numpy.int32),
+                                                ("name", numpy.int32), ("value", numpy.float64)])
+        for i, (kind, t, microservice, name, value) in enumerate(events):
+            if name is None:
+                name_index = -1
+            else:
+                name_index = name_indices.get(name)
+                if name_index is None:
+                    name_index = name_indices[name] = len(names)
+                    names.append(name)
+            records[i] = (kind, t, microservice, name_index, value)
+
+        numpy.savez_compressed(path, events=records, names=numpy.array(names, dtype=str),
+                               costs=numpy.array([self.costs[EventLog.COST_RUNNING], self.costs[EventLog.COST_FAILURE]]))
+
+    @classmethod
+    def load(cls, path):
+        """
+            Reads an event log previously written with save
+        """
+        import numpy
+
+        with numpy.load(path) as data:
+            records = data["events"]
+            names = [str(x) for x in data["names"]]
+            costs = data["costs"].tolist() if "costs" in data.files else [0, 0]
+
+        log = cls(capacity=max(1, len(records)))
+        for kind, t, microservice, name_index, value in records.tolist():
+            log.record(kind, t, microservice, names[name_index] if name_index >= 0 else None, value)
+        log.costs = {EventLog.COST_RUNNING: costs[0], EventLog.COST_FAILURE: costs[1]}
+        return log
+
+
+def apply_event(microservices, kind, t, microservice, name, value):
+    """
+        Applies an event to the shape of a cloud
+        microservices - microservice index => [label, [[container name, state], ...]], updated in place
+        Returns the [container name, state] removed by REMOVE and REMOVE_FAILED events, None otherwise
+    """
+    if kind == EventLog.MICROSERVICE:
+        microservices[microservice] = [name, []]
+        return None
+    if kind not in (EventLog.CONTAINER, EventLog.FAIL, EventLog.REMOVE_FAILED, EventLog.SPAWN_RECOVERY,
+                    EventLog.SPAWN, EventLog.REMOVE):
+        return None
+
+    containers = microservices.setdefault(microservice, [f"MS_{microservice}", []])[1]
+    if kind == EventLog.CONTAINER:
+        containers.append([name, int(value)])
+    elif kind in (EventLog.SPAWN, EventLog.SPAWN_RECOVERY):
+        containers.append([name, MicroserviceContainer.STATE_ACTIVE])
+    elif kind == EventLog.FAIL:
+        for container in containers:
+            if container[0] == name:
+                container[1] = MicroserviceContainer.STATE_FAILED
+    else:
+        for c in range(len(containers)):
+            if containers[c][0] == name:
+                return containers.pop(c)
+        return [name, "?"]
+    return None
+
+
+class TracePrinter:
+    """
+        Replays an EventLog as the human-readable trace printed by the simulators
+    """
+
+    def __init__(self, out=None):
+        """
+            Creates a new trace printer
+            out - the file to write to, defaults to standard output
+        """
+        self._out = out
+        self._position = 0
+        self._microservices = {}  # Microservice index => [label, [[container name, state], ...]]
+        self._style = EventLog.STYLE_PER_CONTAINER
+        self._cloud_before = None
+
+    def flush(self, event_log):
+        """
+            Prints every event recorded since the previous call
+        """
+        for event in event_log.events(self._position):
+            self._print_event(*event)
+        self._position = event_log.position
+
+    def _microservice_str(self, i):
+        label, containers = self._microservices.get(i, (f"MS_{i}", []))
+        if len(containers) > 0:
+            return label + ": " + ", ".join(f"{name} ({state})" for name, state in containers)
+        return label + ": No containers"
+
+    def _cloud_str(self):
+        return " | ".join(self._microservice_str(i) for i in sorted(self._microservices))
+
+    def _write(self, msg):
+        print(msg, file=self._out if self._out is not None else sys.stdout)
+
+    def _print_event(self, kind, t, microservice, name, value):
+        removed = apply_event(self._microservices, kind, t, microservice, name, value)
+        if kind == EventLog.FAIL:
+            self._write(f"[SIM] Container {name} failed at local time {value:.2f}.")
+        elif kind == EventLog.REMOVE_FAILED:
+            name, state = removed
+            self._write(f"[ORCH] Removed {name} ({state}) from the cloud due to failure.")
+        elif kind == EventLog.SPAWN_RECOVERY:
+            self._write(f"[ORCH] Microservice {self._microservice_str(microservice)} was in a failure state. Spawned one container.")
+        elif kind == EventLog.SPAWN:
+            if self._style == EventLog.STYLE_PER_CONTAINER:
+                self._write(f"[ORCH] Spawned new redundant container {name} ({MicroserviceContainer.STATE_ACTIVE}).")
+        elif kind == EventLog.REMOVE:
+            name, state = removed
+            if self._style == EventLog.STYLE_PER_CONTAINER:
+                self._write(f"[ORCH] Removed superfluous container {name} ({state}).")
+        elif kind == EventLog.ORCHESTRATE_BEGIN:
+            self._style = int(value)
+            if self._style == EventLog.STYLE_SUMMARY:
+                self._cloud_before = self._cloud_str()
+            else:
+                self._write("[ORCH] Running orchestrator ...")
+        elif kind == EventLog.ORCHESTRATE_END:
+            if self._style == EventLog.STYLE_SUMMARY:
+                cloud_after = self._cloud_str()
+                if self._cloud_before != cloud_after:
+                    self._write(f"[ORCH] {self._cloud_before} -> {cloud_after}")
+            self._style = EventLog.STYLE_PER_CONTAINER
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} <event log .npz>")
+        return 1
+
+    TracePrinter().flush(EventLog.load(sys.argv[1]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,12 +4,14 @@ from Microservice import *
 from MicroserviceContainer import *
 from Simulator import *
 from SpotMarketProvider import *
+from EventLog import *
+from TimeSeries import *
 
 import math
-import statistics
-import sys
 import numpy
 import copy
+import random
+import time
 
 
 class ExponentialMicroservice(Microservice):
@@ -22,8 +24,15 @@ class ExponentialMicroservice(Microservice):
 
 
 class SpotMarketProvider1(SpotMarketProvider):
+    def __init__(self, day_length=SpotMarketProvider.DAY_LENGTH):
+        """
+            day_length - the number of seconds of global time in a simulated day
+        """
+        super().__init__()
+        self._day_length = day_length
+
     def _cost_of_failure_per_second(self, t):
-        hour = 24 * t/5
+        hour = 24 * t/self._day_length
         if hour < 6:
             return 1
         elif hour < 7:
@@ -50,6 +59,13 @@ class SpotMarketProvider1(SpotMarketProvider):
         return 1
 
 class SpotMarketProvider2(SpotMarketProvider):
+    def __init__(self, day_length=SpotMarketProvider.DAY_LENGTH):
+        """
+            day_length - the number of seconds of global time in a simulated day
+        """
+        super().__init__()
+        self._day_length = day_length
+
     def _cost_of_failure_per_second(self, t):
         return 100000
 
@@ -57,7 +73,7 @@ class SpotMarketProvider2(SpotMarketProvider):
         """
             Returns the spot market price per second at time t
         """
-        hour = 24 * t / 5
+        hour = 24 * t / self._day_length
         if hour < 6:
             return 1
         elif hour < 7:
@@ -82,59 +98,175 @@ class SpotMarketOrchestrator(Orchestrator):
     """
         The orchestrator's policy is to recalculate the parameters according to a SpotMarketProvider
     """
+    # Number of run latencies kept in anytime mode, a uniform sample of every run's for the percentiles, which bounds the
+    # memory of long-lived orchestrators such as those kept warm by the DecisionService
+    LATENCY_SAMPLES = 4096
 
-    def __init__(self, orchestrator_delta, spot_market_provider):
+    def __init__(self, orchestrator_delta, spot_market_provider, time_budget=None, measure_unclaimed=False):
         """
             Creates a new orchestrator on the given cloud
             cloud - the cloud to orchestrate
             delta - the period of time for which the orchestrator will ensure reliability
             cost_of_failure - The cost of a failure
+            time_budget - if set, the compute time (seconds) allowed per run; the best decision found within it is used
+                          (anytime mode), evaluating the most promising candidates first
+            measure_unclaimed - in anytime mode, whether to also compute the unbounded decision when the deadline is hit
+                                to measure the utility left unclaimed (not counted towards the run's latency)
         """
         self.orchestrator_delta = orchestrator_delta
         self._spot_market_provider = spot_market_provider
+        self.time_budget = time_budget
+        self._measure_unclaimed = measure_unclaimed
+        self._deadline = None
+        self._deadline_hit = False
+
+        # Latency accounting
+        self.runs = 0
+        self.deadline_hits = 0
+        self.unclaimed_utility = 0 # Total reduction in expected cost the unbounded decisions would have achieved in addition
+        self.latencies = [] # Compute time (seconds) of a sample of the runs in anytime mode, see _record_latency
+        self._latencies_recorded = 0
+        self._latency_random = random.Random(0) # Samples the latencies without touching the simulation's random state
 
     def orchestrate(self, cloud, t):
-        #self.print_trace("Running orchestrator ...")
+        anytime = self.time_budget is not None
+        start = time.perf_counter() if anytime else None
         super().orchestrate(cloud, t)
         self._ensure_at_least_one_container(cloud, t)
 
-        cloud_before = str(cloud)
-        while True:
+        reference_cloud = None
+        if anytime and self._measure_unclaimed:
+            copy_start = time.perf_counter()
+            reference_cloud = copy.deepcopy(cloud)
+            start += time.perf_counter() - copy_start
+
+        self._deadline = start + self.time_budget if anytime else None
+        self._deadline_hit = False
+        if self._trace:
+            self._event_log.record(EventLog.ORCHESTRATE_BEGIN, t, value=EventLog.STYLE_SUMMARY)
+        self._decide(cloud, t, trace=self._trace)
+        if self._trace:
+            self._event_log.record(EventLog.ORCHESTRATE_END, t)
+
+        self.runs += 1
+        if anytime:
+            self._record_latency(time.perf_counter() - start)
+        if self._deadline_hit:
+            self.deadline_hits += 1
+            if reference_cloud is not None:
+                self.unclaimed_utility += self._unclaimed_utility(cloud, reference_cloud, t)
+        self._deadline = None
+
+    def _decide(self, cloud, t, trace=False):
+        """
+            Adds, then removes, containers until no change has a positive utility or the deadline is reached
+        """
+        while not self._out_of_time():
             # Attempt to add redundant microservices until no further utility is reached
             selected_microservice = self.select_microservice_for_redundancy(cloud, t, self.orchestrator_delta)
             if selected_microservice is not None:
                 new_container = cloud.microservices[selected_microservice].spawn_container(t0=t)
-                #self.print_trace(f"Spawned new redundant container {cloud.microservices[selected_microservice].__class__.__name__}({cloud.microservices[selected_microservice].cost}) {new_container}.")
+                if trace:
+                    self._event_log.record(EventLog.SPAWN, t, selected_microservice, new_container.name)
             else:
-                #self.print_trace("No new microservices to add.")
                 break
 
-        while True:
+        while not self._out_of_time():
             # Now, attempt to reduce any excess redundant microservices until no further utility is reached
             selected_microservice, selected_container = self.select_container_for_removal(cloud, t, self.orchestrator_delta)
             if selected_microservice is not None and selected_container is not None:
                 removed_container = cloud.microservices[selected_microservice].remove_container(index=selected_container)
-                #self.print_trace(f"Removed excess container {cloud.microservices[selected_microservice].__class__.__name__}({cloud.microservices[selected_microservice].cost}) {removed_container}.")
+                if trace:
+                    self._event_log.record(EventLog.REMOVE, t, selected_microservice, removed_container.name)
             else:
-                #self.print_trace("No excess containers to remove.")
                 break
-        cloud_after = str(cloud)
 
-        if cloud_before != cloud_after:
-            self.print_trace(f"{cloud_before} -> {cloud_after}")
+    def _record_latency(self, latency):
+        """
+            Adds the latency of a run to a uniform sample of at most LATENCY_SAMPLES latencies (reservoir sampling), so
+            that long-lived orchestrators use bounded memory
+        """
+        self._latencies_recorded += 1
+        if len(self.latencies) < SpotMarketOrchestrator.LATENCY_SAMPLES:
+            self.latencies.append(latency)
+        else:
+            i = self._latency_random.randrange(self._latencies_recorded)
+            if i < SpotMarketOrchestrator.LATENCY_SAMPLES:
+                self.latencies[i] = latency
+
+    def _out_of_time(self):
+        """
+            Returns whether the deadline of the current run has passed, recording that it was hit
+        """
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            self._deadline_hit = True
+        return self._deadline_hit
+
+    def _unclaimed_utility(self, cloud, reference_cloud, t):
+        """
+            Returns how much lower the expected cost of the unbounded decision is than that of the decision made
+            reference_cloud - a copy of the cloud from before the decision was made
+        """
+        # The unbounded decision must not change the random draws of the simulation
+        random_state, numpy_state = random.getstate(), numpy.random.get_state()
+        self._deadline = None
+        self._deadline_hit = False
+        self._decide(reference_cloud, t)
+        self._deadline_hit = True
+        random.setstate(random_state)
+        numpy.random.set_state(numpy_state)
+
+        return max(0, self.expected_cost(cloud, t, self.orchestrator_delta) - self.expected_cost(reference_cloud, t, self.orchestrator_delta))
+
+    def expected_cost(self, cloud, t, delta):
+        """
+            Returns the expected cost of failure plus the running cost of the cloud over (t, t+delta)
+        """
+        running_cost = sum(microservice.cost * len(microservice.containers) for microservice in cloud.microservices)
+        return self.expected_cost_of_failure(t, delta, cloud) + running_cost * self._spot_market_provider.spot_price(t, delta)
+
+    def deadline_statistics(self):
+        """
+            Returns the latency accounting of the orchestrator's runs
+            The latency percentiles are only measured in anytime mode, and estimated from a sample once there have been
+            more than LATENCY_SAMPLES runs
+        """
+        latencies = self.latencies
+        return {
+            "runs": self.runs,
+            "deadline_hits": self.deadline_hits,
+            "unclaimed_utility": self.unclaimed_utility,
+            "p50_latency": float(numpy.percentile(latencies, 50)) if len(latencies) > 0 else 0,
+            "p99_latency": float(numpy.percentile(latencies, 99)) if len(latencies) > 0 else 0,
+        }
+
+    def _candidate_microservices(self, cloud, t, delta, most_reliable_first):
+        """
+            Returns the indices into cloud.microservices in the order their candidates should be evaluated
+            In anytime mode the least reliable microservices are the most valuable to add to (and the most reliable
+            the most valuable to remove from), so they are evaluated first
+        """
+        if self._deadline is None:
+            return range(len(cloud.microservices))
+        probabilities = [microservice.probability_of_failure(t, delta) for microservice in cloud.microservices]
+        return sorted(range(len(cloud.microservices)), key=lambda i: probabilities[i], reverse=not most_reliable_first)
 
     def select_container_for_removal(self, cloud, t, delta):
         """
         Selects which microservice to shutdown to improve the overall running cost with respect to the failure cost
         Returns (the index into cloud.microservices, the index into cloud.microservices[i].containers)
         If no microservice should be removed, None is returned
+        In anytime mode, the best candidate evaluated before the deadline is returned
         """
         current_expected_cost_of_failure = self.expected_cost_of_failure(t, delta, cloud)
         highest_utility = 0
         selected_microservice = None
         selected_container = None
-        for i in range(len(cloud.microservices)):
+        for i in self._candidate_microservices(cloud, t, delta, most_reliable_first=True):
             for c in range(len(cloud.microservices[i].containers)):
+                if self._out_of_time():
+                    return selected_microservice, selected_container
+
                 proposed_cloud = copy.deepcopy(cloud)
                 proposed_cloud.microservices[i].remove_container(index=c)
                 proposed_expected_cost_of_failure = self.expected_cost_of_failure(t, delta, proposed_cloud)
@@ -153,11 +285,15 @@ class SpotMarketOrchestrator(Orchestrator):
             Selects which microservice container provides the highest utility function
             Returns the index into cloud.microservices
             If no microservice provides a positive utility, None is returned
+            In anytime mode, the best candidate evaluated before the deadline is returned
         """
         current_expected_cost_of_failure = self.expected_cost_of_failure(t, delta, cloud)
         highest_utility = 0
         selected_microservice = None
-        for i in range(len(cloud.microservices)):
+        for i in self._candidate_microservices(cloud, t, delta, most_reliable_first=False):
+            if self._out_of_time():
+                break
+
             proposed_cloud = copy.deepcopy(cloud)
             proposed_cloud.microservices[i].spawn_container(t0=t)
             proposed_expected_cost_of_failure = self.expected_cost_of_failure(t, delta, proposed_cloud)
@@ -195,20 +331,69 @@ class ControlOrchestrator(Orchestrator):
         self._cost_of_failure = cost_of_failure
 
     def orchestrate(self, cloud, t):
-        self.print_trace("Running orchestrator ...")
+        if self._trace:
+            self._event_log.record(EventLog.ORCHESTRATE_BEGIN, t, value=EventLog.STYLE_PER_CONTAINER)
         super().orchestrate(cloud, t)
         self._ensure_at_least_one_container(cloud, t)
 
-        for microservice in cloud.microservices:
+        for m, microservice in enumerate(cloud.microservices):
             while microservice.probability_of_failure(t, self.orchestrator_delta) >= 0.000000001:
                 # The reliability of the microservice has dropped below the threshold level
                 # Attempt to add redundant microservices
                 new_container = microservice.spawn_container(t0=t)
-                self.print_trace(f"Spawned new redundant container {new_container}.")
+                if self._trace:
+                    self._event_log.record(EventLog.SPAWN, t, m, new_container.name)
 
             while microservice.probability_of_failure(t, self.orchestrator_delta) < 0.000000001 and len(microservice.containers) > 1:
                 removed_container = microservice.remove_container(0)
-                self.print_trace(f"Removed superfluous container {removed_container}.")
+                if self._trace:
+                    self._event_log.record(EventLog.REMOVE, t, m, removed_container.name)
+
+        if self._trace:
+            self._event_log.record(EventLog.ORCHESTRATE_END, t)
+
+
+class ExperimentalOrchestrator(Orchestrator):
+    """
+        The orchestrator's policy is to maintain the reliability of the system above 90 percent
+    """
+
+    def __init__(self, orchestrator_delta, cost_of_failure=1):
+        """
+            Creates a new orchestrator on the given cloud
+            cloud - the cloud to orchestrate
+            delta - the period of time for which the orchestrator will ensure reliability
+            cost_of_failure - The cost of a failure
+        """
+        self.orchestrator_delta = orchestrator_delta
+        self._cost_of_failure = cost_of_failure
+
+    def orchestrate(self, cloud, t):
+        if self._trace:
+            self._event_log.record(EventLog.ORCHESTRATE_BEGIN, t, value=EventLog.STYLE_PER_CONTAINER)
+        super().orchestrate(cloud, t)
+
+        while True:
+            # The reliability of the cloud has dropped below the threshold level
+            # Attempt to add redundant microservices
+            selected_microservice = self.select_microservice_for_redundancy(cloud, t, self.orchestrator_delta)
+            if selected_microservice is not None:
+                new_container = cloud.microservices[selected_microservice].spawn_container(t0=t)
+                if self._trace:
+                    self._event_log.record(EventLog.SPAWN, t, selected_microservice, new_container.name)
+            else:
+                break
+
+        if self._trace:
+            self._event_log.record(EventLog.ORCHESTRATE_END, t)
+
+
+class NOPOrchestrator(Orchestrator):
+    def expected_cost_of_failure(self, t, delta, cloud):
+        return 1
+
+    def orchestrate(self, cloud, t):
+        pass
 
 
 class SpotMarketSimulator(Simulator):
@@ -224,25 +409,34 @@ class SpotMarketSimulator(Simulator):
             self._time_since_orchestrator = 0
 
         # Probabilistically update the failure or acceptance state of each container
-        for microservice in self.cloud.microservices:
+        running_cost_before = self._running_cost
+        for m, microservice in enumerate(self.cloud.microservices):
             for container in microservice.containers:
                 if container.state == MicroserviceContainer.STATE_ACTIVE:
                     # If the container has failed, we do not ever change its state again
                     # This container has not failed, so see if it is scheduled to fail this interval
                     if container.global_to_local_time(self._t) + self._sim_clock_step >= container.local_failure_time:
-                        container.state = MicroserviceContainer.STATE_FAILED
+                        microservice.fail_container(container)
                         self._failed_containers.append(container.local_failure_time)
-                        self.print_trace(f"Container {container.name} failed at local time {container.local_failure_time:.2f}.")
+                        if self._trace:
+                            self.event_log.record(EventLog.FAIL, self._t, m, container.name, container.local_failure_time)
 
                     # Update the running cost of the container
                     self._running_cost += microservice.cost * self.orchestrator._spot_market_provider.spot_price(self._t, self._sim_clock_step)
 
-        if self.cloud.probability_of_failure(self._t, self._sim_clock_step) >= 1:
+        step_failure_cost = 0
+        task_failure_probability = self.cloud.probability_of_failure(self._t, self._sim_clock_step)
+        if task_failure_probability >= 1:
             # The cloud has failed in this iteration
-            self._actual_cost_of_failures += self.orchestrator._spot_market_provider.cost_of_failure(self._t, self._sim_clock_step)
+            step_failure_cost = self.orchestrator._spot_market_provider.cost_of_failure(self._t, self._sim_clock_step)
+            self._actual_cost_of_failures += step_failure_cost
+
+        if self._trace:
+            self.event_log.add_cost(EventLog.COST_RUNNING, self._running_cost - running_cost_before)
+            self.event_log.add_cost(EventLog.COST_FAILURE, step_failure_cost)
 
         # Update the outputs
-        self._task_failure_probability.append(self.cloud.probability_of_failure(self._t, self._sim_clock_step))
+        self._task_failure_probability.append(task_failure_probability)
         self._expected_costs_of_failure.append(
             self.orchestrator.expected_cost_of_failure(self._t, self._sim_clock_step, self.cloud))
 
@@ -250,113 +444,65 @@ class SpotMarketSimulator(Simulator):
         self._t += self._sim_clock_step
         self._time_since_orchestrator += self._sim_clock_step
 
-def spot_market_experiment(trace, cloud, orchestrator):
+def spot_market_experiment(trace, cloud, orchestrator, sim_clock_step=0.01, number_of_steps=500, decimation=1,
+                           decimation_mode=TimeSeries.SAMPLE):
+    """
+        Runs a spot market simulation for number_of_steps iterations
+        The per-step results are stored in simulator.series, keyed by their label
+        decimation, decimation_mode - how the per-step results are reduced (see TimeSeries)
+    """
     simulator = SpotMarketSimulator(
         orchestrator=orchestrator,
-        cloud=cloud, sim_clock_step=0.01,
-        orchestrator_run_period=orchestrator.orchestrator_delta, trace=trace)
-    number_of_steps = 500
-
-    microservice_redundancy = []
-    for ms in cloud.microservices:
-        microservice_redundancy.append([])
-    p_failure = []
-    running_cost = []
-    expected_failure_cost = []
-    actual_failure_cost = []
-    spot_price = []
-    catastrophic_failure_cost = []
+        cloud=cloud, sim_clock_step=sim_clock_step,
+        orchestrator_run_period=orchestrator.orchestrator_delta, trace=trace,
+        number_of_steps=number_of_steps, decimation=decimation, decimation_mode=decimation_mode)
+    spot_market_provider = simulator.orchestrator._spot_market_provider
+
+    def new_series(dtype=numpy.float64):
+        return TimeSeries(number_of_steps, decimation, decimation_mode, dtype=dtype)
+
+    p_failure = new_series()
+    running_cost = new_series()
+    expected_failure_cost = new_series()
+    actual_failure_cost = new_series()
+    spot_price = new_series()
+    catastrophic_failure_cost = new_series()
+    microservice_redundancy = [new_series(dtype=numpy.int64) for ms in cloud.microservices]
 
     for i in range(0, number_of_steps):
         previous_running_cost = simulator._running_cost
         previous_actual_failure_cost = simulator._actual_cost_of_failures
 
         simulator.iterate()
-        p_failure.append(cloud.probability_of_failure(simulator._t, simulator._sim_clock_step))
+        probability_of_failure = cloud.probability_of_failure(simulator._t, simulator._sim_clock_step)
+        p_failure.append(probability_of_failure)
         running_cost.append(simulator._running_cost - previous_running_cost)
         actual_failure_cost.append(simulator._actual_cost_of_failures - previous_actual_failure_cost)
-        expected_failure_cost.append(cloud.probability_of_failure(simulator._t, simulator._sim_clock_step))
-        spot_price.append(simulator.orchestrator._spot_market_provider._spot_price_per_second(simulator._t))
-        catastrophic_failure_cost.append(simulator.orchestrator._spot_market_provider._cost_of_failure_per_second(simulator._t))
+        expected_failure_cost.append(probability_of_failure)
+        spot_price.append(spot_market_provider._spot_price_per_second(simulator._t))
+        catastrophic_failure_cost.append(spot_market_provider._cost_of_failure_per_second(simulator._t))
 
         for m in range(0, len(cloud.microservices)):
-            microservice_redundancy[m].append(len(list(filter(lambda container: container.state == MicroserviceContainer.STATE_ACTIVE, cloud.microservices[m].containers))))
-
-        #if trace:
-        #    print(f"[{i}] (t={simulator._t:.2f}s): [P(failure)={p_failure}, FC={simulator.orchestrator._spot_market_provider._cost_of_failure_per_second(simulator._t)}] {str(cloud)}")
+            microservice_redundancy[m].append(cloud.microservices[m].active_containers)
 
     simulator.finalize()
 
+    simulator.series = {
+        "Probability of failure": p_failure,
+        "Running cost": running_cost,
+        "Expected failure cost": expected_failure_cost,
+        "Actual failure cost": actual_failure_cost,
+        "Spot price": spot_price,
+        "Catastrophic failure cost": catastrophic_failure_cost,
+    }
+    for i in range(0, len(cloud.microservices)):
+        simulator.series[f"Redundancy of MS {cloud.microservices[i].name}"] = microservice_redundancy[i]
+
     if trace:
+        TracePrinter().flush(simulator.event_log)
         print("Spot Market Behavior Results:")
-        print(f"t,{','.join([str(x * simulator._sim_clock_step) for x in range(0, number_of_steps)])}")
-        print(f"Probability of failure,{','.join([str(x) for x in p_failure])}")
-        print(f"Running cost,{','.join([str(x) for x in running_cost])}")
-        print(f"Expected failure cost,{','.join([str(x) for x in expected_failure_cost])}")
-        print(f"Actual failure cost,{','.join([str(x) for x in actual_failure_cost])}")
-        print(f"Spot price,{','.join([str(x) for x in spot_price])}")
-        print(f"Catastrophic failure cost,{','.join([str(x) for x in catastrophic_failure_cost])}")
-
-        for i in range(0, len(cloud.microservices)):
-            print(f"Redundancy of MS {cloud.microservices[i].name},{','.join([str(x) for x in microservice_redundancy[i]])}")
+        print(f"t,{','.join([str(x * simulator._sim_clock_step) for x in p_failure.steps().tolist()])}")
+        for label, series in simulator.series.items():
+            print(f"{label},{','.join([str(x) for x in series.values.tolist()])}")
 
     return simulator
-
-
-def main():
-    output_file = None
-    if len(sys.argv) > 1:
-        output_file = open(sys.argv[1], "w")
-        output_file.write("Experiment,Parameter\n")
-
-    container_failure_times = []
-    running_costs = []
-    actual_costs_of_failure = []
-    trace = True
-    num_experiments = 1
-
-    for x in range(num_experiments):
-        print(f"Experiment {x}")
-        cloud = Cloud([ExponentialMicroservice(name="3-Cost MS", num_containers=1, cost=0.03), ExponentialMicroservice(name="5-Cost MS", num_containers=1, cost=.05)])
-        spot_market_provider = SpotMarketProvider1()
-        orchestrator = SpotMarketOrchestrator(orchestrator_delta=.01, spot_market_provider=spot_market_provider)
-        #orchestrator = ControlOrchestrator(orchestrator_delta=.1, spot_market_provider=spot_market_provider)
-        simulator = spot_market_experiment(trace, cloud, orchestrator)
-
-        # Prepare the output results
-        output_results = f"\n{x},RunningCost,{simulator._running_cost}"
-        output_results += f"\n{x},ActualCostOfFailure,{simulator._actual_cost_of_failures}"
-        output_results += "\n"
-        if output_file is not None:
-            output_file.write(output_results)
-
-        if trace:
-            print("Final aggregated results:")
-            print(output_results)
-
-        for res in simulator._failed_containers:
-            container_failure_times.append(res)
-
-        running_costs.append(simulator._running_cost)
-        actual_costs_of_failure.append(simulator._actual_cost_of_failures)
-
-    if len(container_failure_times) > 1:
-        print(f"Container Failure Times >> Mean: {statistics.mean(container_failure_times)} | Median: {statistics.median(container_failure_times)} | Variance: {statistics.variance(container_failure_times)}")
-
-    if len(running_costs) > 1:
-        print(f"Running Cost >> Mean: {statistics.mean(running_costs)} | Median: {statistics.median(running_costs)} | Variance: {statistics.variance(running_costs)}")
-
-    if len(actual_costs_of_failure) > 1:
-        print(f"Actual Cost of Failures >> Mean: {statistics.mean(actual_costs_of_failure)} | Median: {statistics.median(actual_costs_of_failure)} | Variance: {statistics.variance(actual_costs_of_failure)}")
-        total_costs = []
-        for i in range(0, len(actual_costs_of_failure)):
-            total_costs.append(running_costs[i] + actual_costs_of_failure[i])
-
-        print(f"Total Cost >> Mean: {statistics.mean(total_costs)} | Median: {statistics.median(total_costs)} | Variance: {statistics.variance(total_costs)}")
-
-    if output_file is not None:
-        output_file.close()
-
-
-if __name__ == '__main__':
-    main()
\ No newline at end of file
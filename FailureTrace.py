@@ -0,0 +1,249 @@
+import bisect
+import copy
+import csv
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+
+import numpy
+
+from Microservice import Microservice
+
+
+class FailureTrace:
+    """
+        Recorded container lifetimes, grouped by microservice in a memory-mapped binary file
+
+        A trace directory holds lifetimes.f64 (the lifetimes of every microservice, contiguous per microservice) and
+        index.json ({"microservices": {name: [offset, count]}, "fingerprint": hash of the contents}). Build one from a
+        CSV with FailureTrace.build.
+    """
+    LOOP = "loop"  # Replay the lifetimes in order, restarting from the first once they are exhausted
+    ONCE = "once"  # Replay the lifetimes in order once, raising an error once they are exhausted
+    BOOTSTRAP = "bootstrap"  # Resample the lifetimes uniformly with replacement
+
+    CHUNK = 4096  # Number of lifetimes read from the file at a time
+
+    _open_traces = {}
+
+    def __init__(self, directory):
+        """
+            Opens a trace directory
+        """
+        self._stamp = FailureTrace._stamp(directory)
+        with open(os.path.join(directory, "index.json")) as f:
+            self._index = json.load(f)["microservices"]
+        self._lifetimes = numpy.memmap(os.path.join(directory, "lifetimes.f64"), dtype=numpy.float64, mode="r")
+
+    @classmethod
+    def open(cls, directory):
+        """
+            Returns the trace in directory, sharing one memory map between all its users
+            The trace is reopened if it has been rebuilt since it was opened
+        """
+        directory = os.path.abspath(directory)
+        trace = cls._open_traces.get(directory)
+        if trace is None or trace._stamp != FailureTrace._stamp(directory):
+            trace = cls._open_traces[directory] = cls(directory)
+        return trace
+
+    @staticmethod
+    def _stamp(directory):
+        stat = os.stat(os.path.join(directory, "index.json"))
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def fingerprint(directory):
+        """
+            Returns a string that changes whenever the trace in directory is rebuilt
+        """
+        with open(os.path.join(directory, "index.json")) as f:
+            fingerprint = json.load(f).get("fingerprint")
+        if fingerprint is None:
+            # Traces built before fingerprints were recorded
+            stat = os.stat(os.path.join(directory, "lifetimes.f64"))
+            fingerprint = "{}:{}:{}:{}".format(stat.st_size, stat.st_mtime_ns, *FailureTrace._stamp(directory))
+        return fingerprint
+
+    @staticmethod
+    def build(csv_path, directory, microservice_column="microservice", lifetime_column="lifetime", buffer_rows=1 << 20):
+        """
+            Converts a CSV of recorded lifetimes into a trace directory in two streaming passes
+            csv_path - a CSV with a header row containing microservice_column and lifetime_column
+            directory - the trace directory to create
+            buffer_rows - the number of lifetimes held in memory before they are written out
+        """
+        def rows():
+            with open(csv_path, newline="") as f:
+                reader = csv.reader(f)
+                header = next(reader)
+                microservice_index = header.index(microservice_column)
+                lifetime_index = header.index(lifetime_column)
+                for row in reader:
+                    if len(row) > max(microservice_index, lifetime_index):
+                        yield row[microservice_index], row[lifetime_index]
+
+        # First pass: count the lifetimes of each microservice to lay them out contiguously
+        counts = {}
+        for microservice, lifetime in rows():
+            counts[microservice] = counts.get(microservice, 0) + 1
+
+        index = {}
+        offset = 0
+        for microservice in sorted(counts):
+            index[microservice] = [offset, counts[microservice]]
+            offset += counts[microservice]
+
+        # Second pass: write each lifetime at its microservice's cursor
+        # The files are written beside the trace and then moved over it, so that open memory maps of a previous build
+        # keep their (unlinked) file instead of seeing it truncated
+        os.makedirs(directory, exist_ok=True)
+        lifetimes_path = os.path.join(directory, "lifetimes.f64")
+        lifetimes = numpy.memmap(lifetimes_path + ".tmp", dtype=numpy.float64, mode="w+", shape=(max(1, offset),))
+        cursors = {microservice: index[microservice][0] for microservice in index}
+        buffers = {}
+        buffered = 0
+
+        def flush():
+            for microservice, values in buffers.items():
+                cursor = cursors[microservice]
+                lifetimes[cursor:cursor + len(values)] = values
+                cursors[microservice] = cursor + len(values)
+            buffers.clear()
+
+        for microservice, lifetime in rows():
+            buffers.setdefault(microservice, []).append(float(lifetime))
+            buffered += 1
+            if buffered >= buffer_rows:
+                flush()
+                buffered = 0
+        flush()
+        lifetimes.flush()
+        del lifetimes
+
+        h = hashlib.sha256(json.dumps(index, sort_keys=True).encode())
+        with open(lifetimes_path + ".tmp", "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        os.replace(lifetimes_path + ".tmp", lifetimes_path)
+
+        index_path = os.path.join(directory, "index.json")
+        with open(index_path + ".tmp", "w") as f:
+            json.dump({"microservices": index, "fingerprint": h.hexdigest()}, f)
+        os.replace(index_path + ".tmp", index_path)
+
+    @property
+    def microservices(self):
+        return list(self._index)
+
+    def lifetimes(self, microservice):
+        """
+            Returns a read-only, memory-mapped view of the lifetimes of the microservice
+        """
+        if microservice not in self._index:
+            raise KeyError(f"No lifetimes recorded for microservice '{microservice}'")
+        offset, count = self._index[microservice]
+        return self._lifetimes[offset:offset + count]
+
+    def stream(self, microservice, mode=LOOP, rng=None):
+        """
+            Yields the lifetimes of the microservice, reading CHUNK lifetimes from the file at a time
+            mode - FailureTrace.LOOP, FailureTrace.ONCE or FailureTrace.BOOTSTRAP
+            rng - the numpy.random.Generator used by BOOTSTRAP, defaults to the global numpy random state
+        """
+        lifetimes = self.lifetimes(microservice)
+        if len(lifetimes) == 0:
+            raise ValueError(f"No lifetimes recorded for microservice '{microservice}'")
+
+        if mode == FailureTrace.BOOTSTRAP:
+            randint = rng.integers if rng is not None else numpy.random.randint
+            while True:
+                yield from lifetimes[randint(0, len(lifetimes), FailureTrace.CHUNK)].tolist()
+        elif mode in (FailureTrace.LOOP, FailureTrace.ONCE):
+            while True:
+                for start in range(0, len(lifetimes), FailureTrace.CHUNK):
+                    yield from lifetimes[start:start + FailureTrace.CHUNK].tolist()
+                if mode == FailureTrace.ONCE:
+                    return
+        else:
+            raise ValueError(f"unknown replay mode '{mode}'")
+
+    def sample(self, microservice, size):
+        """
+            Returns a sorted sample of at most size lifetimes, evenly spaced through the trace (from its first to its
+            last lifetime)
+        """
+        lifetimes = self.lifetimes(microservice)
+        indices = numpy.linspace(0, len(lifetimes) - 1, min(size, len(lifetimes))).astype(int)
+        return numpy.sort(lifetimes[indices])
+
+
+class TraceMicroservice(Microservice):
+    """
+        A microservice whose containers replay recorded lifetimes instead of sampling a failure distribution
+        Its failure function is the empirical distribution of (a bounded sample of) the recorded lifetimes
+    """
+
+    def __init__(self, cost, trace, key=None, mode=FailureTrace.LOOP, sample_size=10000, num_containers=0, t0=0, name=None):
+        """
+            Creates a new trace-driven microservice
+            trace - a FailureTrace, or the directory of one
+            key - the microservice in the trace to replay, defaults to name
+            mode - how the lifetimes are replayed (FailureTrace.LOOP, ONCE or BOOTSTRAP)
+            sample_size - the number of lifetimes used for the failure function
+        """
+        if key is None and name is None:
+            raise ValueError("a TraceMicroservice needs a name or key to select the recorded lifetimes to replay")
+        if not isinstance(trace, FailureTrace):
+            trace = FailureTrace.open(trace)
+        key = key if key is not None else name
+
+        # The replay must be ready before the initial containers are spawned by Microservice.__init__
+        self._lifetimes = trace.stream(key, mode)
+        self._sample = trace.sample(key, sample_size).tolist()
+        super().__init__(cost, num_containers=num_containers, t0=t0, name=name)
+
+    def __deepcopy__(self, memo):
+        # The orchestrator deep copies the cloud to evaluate hypothetical spawns, which must not consume recorded
+        # lifetimes (and only use the failure function), so copies never fail and share the sample
+        result = self.__class__.__new__(self.__class__)
+        memo[id(self)] = result
+        for attribute, value in self.__dict__.items():
+            if attribute == "_lifetimes":
+                value = itertools.repeat(math.inf)
+            elif attribute != "_sample":
+                value = copy.deepcopy(value, memo)
+            setattr(result, attribute, value)
+        return result
+
+    def failure_function(self, t):
+        # Scaled by n + 1 so that a container is never certain to have failed (which would make the
+        # conditional probability of failure in MicroserviceContainer undefined)
+        return bisect.bisect_right(self._sample, t) / (len(self._sample) + 1)
+
+    def _select_random_failure_time(self):
+        try:
+            return next(self._lifetimes)
+        except StopIteration:
+            raise RuntimeError(f"The recorded lifetimes of {self.name} are exhausted") from None
+
+
+def main():
+    if not ((len(sys.argv) == 4 and sys.argv[1] == "build") or (len(sys.argv) == 3 and sys.argv[1] == "info")):
+        print(f"Usage: {sys.argv[0]} build <lifetimes.csv> <trace directory> | info <trace directory>")
+        return 1
+
+    if sys.argv[1] == "build":
+        FailureTrace.build(sys.argv[2], sys.argv[3])
+    trace = FailureTrace.open(sys.argv[-1])
+    for microservice in trace.microservices:
+        lifetimes = trace.lifetimes(microservice)
+        print(f"{microservice}: {len(lifetimes)} lifetimes, mean {lifetimes.mean()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
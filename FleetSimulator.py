@@ -0,0 +1,261 @@
+import argparse
+import json
+import random
+import sys
+import time
+
+from MicroserviceContainer import *
+from SpotMarketProvider import SharedSpotMarketProvider
+
+
+class Tenant:
+    """
+        One independent cloud of a fleet, with its own orchestrator and costs
+    """
+
+    def __init__(self, name, cloud, orchestrator, config=None):
+        """
+            Creates a new tenant
+            config - the JSON-serialisable configuration the cloud and orchestrator were built from, if any; only tenants
+                     built from the same configuration share orchestrator decisions
+        """
+        self.name = name
+        self.cloud = cloud
+        self.orchestrator = orchestrator
+        self.config_key = None if config is None else json.dumps(config, sort_keys=True)
+        self.phase = 0 # The step (modulo the orchestrator period) on which the tenant is orchestrated
+
+        # Outputs
+        self.failed_containers = [] # Local failure times of the tenant's containers
+        self.actual_cost_of_failures = 0
+        self.running_cost = 0
+
+
+class FleetSimulator:
+    """
+        Simulates many tenants (clouds with their own spot market orchestrators) against one spot market on a shared clock
+
+        Tenants built from the same configuration (Tenant.config) and orchestrated on the same step share one decision
+        when the state and probability of failure over (t, t + delta) of each of their containers match: the decision of
+        the first of them is replayed on the others instead of being recomputed. The probabilities are compared to
+        decision_precision significant digits, since the same probability computed for containers of different ages
+        differs in its last bits. Tenants without a configuration, and orchestrators in anytime mode (with a
+        time_budget), which depend on the wall clock, always decide on their own.
+    """
+
+    def __init__(self, tenants, spot_market_provider, sim_clock_step=0.01, orchestrator_run_period=0.01, stagger=True,
+                 share_decisions=True, decision_precision=12):
+        """
+            Creates a new fleet simulation
+            tenants - the Tenant objects
+            spot_market_provider - the spot market shared by every tenant; the tenants' orchestrators are switched to it
+            sim_clock_step - by how much the simulation clock increments each iteration
+            orchestrator_run_period - how often each tenant is orchestrated
+            stagger - whether to spread the tenants' orchestration over the steps of each period in batches, instead of
+                      orchestrating every tenant on the same step
+            share_decisions - whether tenants built from the same configuration that see the same cloud share one decision
+            decision_precision - the significant digits to which probabilities of failure must match for tenants to share
+                                 a decision, None to require them to be equal
+        """
+        if not isinstance(spot_market_provider, SharedSpotMarketProvider):
+            spot_market_provider = SharedSpotMarketProvider(spot_market_provider)
+        self.spot_market_provider = spot_market_provider
+        self.tenants = tenants
+        self._sim_clock_step = sim_clock_step
+        self._t = 0
+        self._step = 0
+        self._steps_per_period = max(1, round(orchestrator_run_period / sim_clock_step))
+        self._share_decisions = share_decisions
+        self._decision_precision = decision_precision
+
+        # Outputs
+        self.orchestrations = 0 # Number of times a tenant was orchestrated
+        self.decisions = 0 # Number of orchestrator decisions actually computed
+
+        for i, tenant in enumerate(tenants):
+            tenant.orchestrator._spot_market_provider = spot_market_provider
+            tenant.phase = i % self._steps_per_period if stagger else 0
+
+    def _orchestration_batch(self):
+        """
+            Returns the tenants to orchestrate this step
+        """
+        if self._step == 0:
+            # Like the Simulator, every orchestrator runs immediately on beginning of simulation
+            return self.tenants
+        phase = self._step % self._steps_per_period
+        return [tenant for tenant in self.tenants if tenant.phase == phase]
+
+    def _decision_key(self, tenant, t):
+        """
+            Returns everything the tenant's orchestrator decides on at global time t
+        """
+        orchestrator = tenant.orchestrator
+        delta = orchestrator.orchestrator_delta
+        precision = self._decision_precision
+
+        def probability_of_failure(container):
+            p = container.probability_of_failure(t, delta)
+            return p if precision is None else float(f"{p:.{precision}g}")
+
+        return (tenant.config_key, tuple(
+            (microservice.__class__, microservice.name, microservice.cost,
+             tuple((container.state, probability_of_failure(container)) for container in microservice.containers))
+            for microservice in tenant.cloud.microservices))
+
+    def _orchestrate(self, tenants, t):
+        """
+            Orchestrates the tenants, computing one decision per distinct cloud
+        """
+        decisions = {} # Decision key => for each microservice, the index of each resulting container before the decision (None if spawned)
+        for tenant in tenants:
+            self.orchestrations += 1
+            if (not self._share_decisions or tenant.config_key is None
+                    or getattr(tenant.orchestrator, "time_budget", None) is not None):
+                tenant.orchestrator.orchestrate(tenant.cloud, t)
+                self.decisions += 1
+                continue
+
+            key = self._decision_key(tenant, t)
+            decision = decisions.get(key)
+            if decision is None:
+                # Keep the containers referenced so that their ids are not reused by the spawned ones
+                before = [list(microservice.containers) for microservice in tenant.cloud.microservices]
+                tenant.orchestrator.orchestrate(tenant.cloud, t)
+                self.decisions += 1
+
+                decision = decisions[key] = []
+                for containers, microservice in zip(before, tenant.cloud.microservices):
+                    indices = {id(container): i for i, container in enumerate(containers)}
+                    decision.append([indices.get(id(container)) for container in microservice.containers])
+            else:
+                for indices, microservice in zip(decision, tenant.cloud.microservices):
+                    containers = microservice.containers
+                    microservice.containers = []
+                    for i in indices:
+                        if i is None:
+                            microservice.spawn_container(t0=t)
+                        else:
+                            microservice.containers.append(containers[i])
+                    microservice.count_active_containers()
+
+    def iterate(self):
+        """
+            Runs the simulation of every tenant for one iteration
+        """
+        t = self._t
+        step = self._sim_clock_step
+
+        # The spot market is evaluated once per step for the whole fleet
+        self.spot_market_provider.advance()
+        spot_price = self.spot_market_provider.spot_price(t, step)
+        cost_of_failure = self.spot_market_provider.cost_of_failure(t, step)
+
+        self._orchestrate(self._orchestration_batch(), t)
+
+        for tenant in self.tenants:
+            for microservice in tenant.cloud.microservices:
+                for container in microservice.containers:
+                    if container.state == MicroserviceContainer.STATE_ACTIVE:
+                        # This container has not failed, so see if it is scheduled to fail this interval
+                        if container.global_to_local_time(t) + step >= container.local_failure_time:
+                            microservice.fail_container(container)
+                            tenant.failed_containers.append(container.local_failure_time)
+
+                        # Update the running cost of the container
+                        tenant.running_cost += microservice.cost * spot_price
+
+            if tenant.cloud.probability_of_failure(t, step) >= 1:
+                # The tenant's cloud has failed in this iteration
+                tenant.actual_cost_of_failures += cost_of_failure
+
+        self._step += 1
+        self._t += step
+
+    def finalize(self):
+        """
+            Adds the containers which survived to the end to the tenants' results
+        """
+        for tenant in self.tenants:
+            for microservice in tenant.cloud.microservices:
+                for container in microservice.containers:
+                    if container.state == MicroserviceContainer.STATE_ACTIVE:
+                        tenant.failed_containers.append(container.local_failure_time)
+
+    @property
+    def running_cost(self):
+        return sum(tenant.running_cost for tenant in self.tenants)
+
+    @property
+    def actual_cost_of_failures(self):
+        return sum(tenant.actual_cost_of_failures for tenant in self.tenants)
+
+
+def fleet_from_scenario(scenario, number_of_tenants, stagger=True, share_decisions=True):
+    """
+        Creates a fleet of identical tenants from a Scenario, sharing the scenario's spot market
+    """
+    if number_of_tenants < 1:
+        raise ValueError("a fleet needs at least one tenant")
+    spot_market_provider = SharedSpotMarketProvider(scenario.build_provider())
+    tenants = []
+    for i in range(number_of_tenants):
+        orchestrator = scenario.build_orchestrator(spot_market_provider)
+        tenants.append(Tenant(f"{scenario.name}-{i}", scenario.build_cloud(), orchestrator, config=scenario.config))
+    return FleetSimulator(tenants, spot_market_provider, sim_clock_step=scenario.sim_clock_step,
+                          orchestrator_run_period=tenants[0].orchestrator.orchestrator_delta, stagger=stagger,
+                          share_decisions=share_decisions)
+
+
+def main(argv=None):
+    from Scenario import Scenario
+
+    parser = argparse.ArgumentParser(description="Simulates a fleet of tenants built from a scenario against one shared spot market")
+    parser.add_argument("scenario", help="scenario JSON file describing each tenant")
+    parser.add_argument("-n", "--tenants", type=int, default=100, help="number of tenants")
+    parser.add_argument("--no-stagger", action="store_true", help="orchestrate every tenant on the same step")
+    parser.add_argument("--no-share", action="store_true", help="compute the decision of every tenant separately")
+    parser.add_argument("--compare", action="store_true", help="also time separate runs of every tenant")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print the costs of every tenant")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    if args.tenants < 1:
+        print("--tenants must be a positive integer", file=sys.stderr)
+        return 2
+
+    scenario = Scenario.from_file(args.scenario)
+    errors = scenario.validate()
+    for error in errors:
+        print(f"{args.scenario}: {error}", file=sys.stderr)
+    if len(errors) > 0:
+        return 1
+
+    if scenario.config["seed"] is not None:
+        import numpy
+        random.seed(scenario.config["seed"])
+        numpy.random.seed(scenario.config["seed"])
+
+    start = time.perf_counter()
+    fleet = fleet_from_scenario(scenario, args.tenants, stagger=not args.no_stagger, share_decisions=not args.no_share)
+    for i in range(scenario.number_of_steps):
+        fleet.iterate()
+    fleet.finalize()
+    elapsed = time.perf_counter() - start
+
+    if args.verbose:
+        for tenant in fleet.tenants:
+            print(f"{tenant.name},RunningCost,{tenant.running_cost},ActualCostOfFailure,{tenant.actual_cost_of_failures}")
+    print(f"Fleet of {len(fleet.tenants)} tenants, {scenario.number_of_steps} steps in {elapsed:.2f}s "
+          f"({fleet.decisions} decisions for {fleet.orchestrations} orchestrations)")
+    print(f"Fleet >> Running Cost: {fleet.running_cost} | Actual Cost of Failures: {fleet.actual_cost_of_failures} | "
+          f"Total Cost: {fleet.running_cost + fleet.actual_cost_of_failures}")
+
+    if args.compare:
+        start = time.perf_counter()
+        for i in range(args.tenants):
+            scenario.run(replica=i)
+        print(f"Separate runs of {args.tenants} tenants in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
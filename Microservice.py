@@ -18,6 +18,7 @@ class Microservice:
         """
         self.cost = cost
         self.containers = []
+        self.active_containers = 0 # Number of containers in the active state, maintained as containers change
 
         if name is None:
             self.name = "MS_" + ''.join(random.choice(string.digits) for i in range(5))
@@ -55,6 +56,7 @@ class Microservice:
 
         container = MicroserviceContainer(self.failure_function, local_failure_time=self._select_random_failure_time(), t0=t0, name=name)
         self.containers.append(container)
+        self.active_containers += 1
         return container
 
     def remove_container(self, index):
@@ -62,7 +64,24 @@ class Microservice:
             Removes the container at the specified index
             Returns the removed container
         """
-        return self.containers.pop(index)
+        container = self.containers.pop(index)
+        if container.state == MicroserviceContainer.STATE_ACTIVE:
+            self.active_containers -= 1
+        return container
+
+    def fail_container(self, container):
+        """
+            Marks an active container of this microservice as failed
+        """
+        container.state = MicroserviceContainer.STATE_FAILED
+        self.active_containers -= 1
+
+    def count_active_containers(self):
+        """
+            Recounts the active containers after self.containers has been replaced or modified directly
+        """
+        self.active_containers = sum(1 for x in self.containers if x.state == MicroserviceContainer.STATE_ACTIVE)
+        return self.active_containers
 
     def probability_of_failure(self, t, delta):
         """
@@ -75,8 +94,14 @@ class Microservice:
         # The probability that the microservice fails is the probability of all redundant containers failing
         return math.prod(failure_function_values)
 
+    def label(self):
+        """
+            Returns the description of the microservice without its containers
+        """
+        return self.__class__.__name__ + "::" + self.name + f" (Cost={self.cost})"
+
     def __str__(self):
-        s = self.__class__.__name__ + "::" + self.name + f" (Cost={self.cost}): "
+        s = self.label() + ": "
         if len(self.containers) > 0:
             s += ", ".join(str(x) for x in self.containers)
         else:
@@ -1,24 +1,39 @@
 from MicroserviceContainer import *
+from EventLog import EventLog
 import copy
 
 
 class Orchestrator:
-    def __init__(self, cost_of_failure=0, trace=False):
+    # Tracing is configured by the Simulator, which shares its event log with the orchestrator
+    _trace = False
+    _event_log = None
+
+    def __init__(self, cost_of_failure=0, trace=False, event_log=None):
+        """
+            Creates a new orchestrator
+            cost_of_failure - the cost of a failure per second
+            trace - whether to record events
+            event_log - the EventLog to record events to, a new one is created if trace is set
+        """
+        if trace and event_log is None:
+            event_log = EventLog()
+
         self._trace = trace
+        self._event_log = event_log
         self._cost_of_failure = cost_of_failure
 
-    def _remove_failed_containers(self, cloud):
+    def _remove_failed_containers(self, cloud, t=0):
         """
             Removes failed containers from the cloud
         """
-        for microservice in cloud.microservices:
+        for m, microservice in enumerate(cloud.microservices):
             new_containers = []
             for i in range(len(microservice.containers)):
                 container = microservice.containers[i]
                 if container.state == MicroserviceContainer.STATE_ACTIVE:
                     new_containers.append(container)
-                else:
-                    self.print_trace(f"Removed {container} from the cloud due to failure.")
+                elif self._trace:
+                    self._event_log.record(EventLog.REMOVE_FAILED, t, m, container.name)
 
             microservice.containers = new_containers
 
@@ -26,10 +41,11 @@ class Orchestrator:
         """
             Ensures that the cloud contains at least one container in each microservice
         """
-        for microservice in cloud.microservices:
+        for m, microservice in enumerate(cloud.microservices):
             if len(microservice.containers) == 0:
-                microservice.spawn_container(t0=t)
-                self.print_trace(f"Microservice {microservice} was in a failure state. Spawned one container.")
+                container = microservice.spawn_container(t0=t)
+                if self._trace:
+                    self._event_log.record(EventLog.SPAWN_RECOVERY, t, m, container.name)
 
     def select_microservice_for_redundancy(self, cloud, t, delta):
         """
@@ -67,9 +83,6 @@ class Orchestrator:
             Runs the orchestration algorithm given the current time
             Returns the cost incurred spawning new instances
         """
-        self._remove_failed_containers(cloud)
+        self._remove_failed_containers(cloud, t)
         return 0
 
-    def print_trace(self, msg):
-        if self._trace:
-            print("[ORCH] " + msg)
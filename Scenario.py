@@ -0,0 +1,302 @@
+import importlib
+import importlib.util
+import json
+import os
+import random
+
+
+class Scenario:
+    """
+        A declarative description of an experiment loaded from a JSON file
+
+        {
+            "name": "spot-market-1",
+            "cloud": [{"name": "3-Cost MS", "cost": 0.03, "containers": 1, "failure_model": "exponential"}],
+            "provider": {"type": "SpotMarketProvider1"},
+            "orchestrator": {"type": "spot_market", "delta": 0.01},
+            "sim_clock_step": 0.01,
+            "horizon": 5,
+            "replicas": 1,
+            "seed": 0,
+            "decimation": 1,
+            "decimation_mode": "sample"
+        }
+
+        Types are looked up in the registries below, or given as "module:Class". A microservice may also give "params",
+        passed to its failure model as keyword arguments, e.g.
+        {"name": "db", "cost": 0.05, "failure_model": "trace", "params": {"trace": "traces/db", "mode": "bootstrap"}}
+        The keyword arguments of the registered types are checked against PARAMETERS; those of "module:Class" types
+        are only checked when the scenario is built.
+        Nothing beyond the standard library is imported until the scenario is built, so that loading and
+        validating scenarios stays fast.
+    """
+    MICROSERVICE_TYPES = {
+        "exponential": "Experiment:ExponentialMicroservice",
+        "trace": "FailureTrace:TraceMicroservice",
+    }
+    PROVIDER_TYPES = {
+        "constant": "SpotMarketProvider:SpotMarketProvider",
+        "schedule": "SpotMarketProvider:ScheduledSpotMarketProvider",
+        "SpotMarketProvider1": "Experiment:SpotMarketProvider1",
+        "SpotMarketProvider2": "Experiment:SpotMarketProvider2",
+    }
+    ORCHESTRATOR_TYPES = {
+        "spot_market": "Experiment:SpotMarketOrchestrator",
+        "control": "Experiment:ControlOrchestrator",
+    }
+
+    # "module:Class" => (allowed keys, required keys) of the registered types, besides "type" and the orchestrators' "delta"
+    PARAMETERS = {
+        "Experiment:ExponentialMicroservice": (set(), set()),
+        "FailureTrace:TraceMicroservice": ({"trace", "key", "mode", "sample_size"}, {"trace"}),
+        "SpotMarketProvider:SpotMarketProvider": (set(), set()),
+        "SpotMarketProvider:ScheduledSpotMarketProvider": ({"cost_of_failure_schedule", "spot_price_schedule", "day_length"}, set()),
+        "Experiment:SpotMarketProvider1": ({"day_length"}, set()),
+        "Experiment:SpotMarketProvider2": ({"day_length"}, set()),
+        "Experiment:SpotMarketOrchestrator": ({"time_budget", "measure_unclaimed"}, set()),
+        "Experiment:ControlOrchestrator": ({"cost_of_failure"}, set()),
+    }
+
+    KEYS = {"name", "cloud", "provider", "orchestrator", "sim_clock_step", "horizon", "replicas", "seed", "decimation",
+            "decimation_mode"}
+    DEFAULTS = {"sim_clock_step": 0.01, "horizon": 5, "replicas": 1, "seed": None, "decimation": 1, "decimation_mode": "sample"}
+
+    def __init__(self, config, path=None):
+        """
+            Creates a new scenario
+            config - the parsed scenario description
+            path - the file the scenario was loaded from, if any
+        """
+        # A config that is not an object is kept as is, to be reported by validate
+        self.config = dict(Scenario.DEFAULTS, **config) if isinstance(config, dict) else config
+        self.path = path
+        if isinstance(config, dict) and "name" in config:
+            self.name = str(config["name"])
+        elif path is not None:
+            self.name = os.path.splitext(os.path.basename(path))[0]
+        else:
+            self.name = "scenario"
+
+    @classmethod
+    def from_file(cls, path):
+        """
+            Loads a scenario from a JSON file
+        """
+        with open(path) as f:
+            return cls(json.load(f), path=path)
+
+    @classmethod
+    def from_paths(cls, paths):
+        """
+            Loads the scenarios in the given files, or in the *.json files of the given directories
+        """
+        scenarios = []
+        for path in paths:
+            if os.path.isdir(path):
+                for file_name in sorted(os.listdir(path)):
+                    if file_name.endswith(".json"):
+                        scenarios.append(cls.from_file(os.path.join(path, file_name)))
+            else:
+                scenarios.append(cls.from_file(path))
+        return scenarios
+
+    @property
+    def sim_clock_step(self):
+        return self.config["sim_clock_step"]
+
+    @property
+    def number_of_steps(self):
+        return int(round(self.config["horizon"] / self.config["sim_clock_step"]))
+
+    @property
+    def replicas(self):
+        return self.config["replicas"]
+
+    def validate(self):
+        """
+            Checks the scenario without importing or building anything
+            Returns a list of error messages, empty if the scenario is valid
+        """
+        errors = []
+        config = self.config
+        if not isinstance(config, dict):
+            return ["the scenario must be an object"]
+
+        for key in sorted(set(config) - Scenario.KEYS):
+            errors.append(f"unknown key '{key}'")
+
+        for key in ("sim_clock_step", "horizon"):
+            if not _is_number(config[key]) or config[key] <= 0:
+                errors.append(f"'{key}' must be a positive number")
+        if not isinstance(config["replicas"], int) or config["replicas"] < 1:
+            errors.append("'replicas' must be a positive integer")
+        if config["seed"] is not None and not isinstance(config["seed"], int):
+            errors.append("'seed' must be an integer")
+        if not isinstance(config["decimation"], int) or config["decimation"] < 1:
+            errors.append("'decimation' must be a positive integer")
+        if config["decimation_mode"] not in ("sample", "window"):
+            errors.append("'decimation_mode' must be 'sample' or 'window'")
+
+        microservices = config.get("cloud")
+        if not isinstance(microservices, list) or len(microservices) == 0:
+            errors.append("'cloud' must be a non-empty list of microservices")
+            microservices = []
+        for i, microservice in enumerate(microservices):
+            where = f"cloud[{i}]"
+            if not isinstance(microservice, dict):
+                errors.append(f"{where} must be an object")
+                continue
+            for key in sorted(set(microservice) - {"name", "cost", "containers", "failure_model", "params"}):
+                errors.append(f"{where}: unknown key '{key}'")
+            if not _is_number(microservice.get("cost")) or microservice["cost"] < 0:
+                errors.append(f"{where}: 'cost' must be a non-negative number")
+            if not isinstance(microservice.get("containers", 1), int) or microservice.get("containers", 1) < 0:
+                errors.append(f"{where}: 'containers' must be a non-negative integer")
+            failure_model = microservice.get("failure_model", "exponential")
+            type_errors = _check_type(where, failure_model, Scenario.MICROSERVICE_TYPES)
+            errors.extend(type_errors)
+            params = microservice.get("params", {})
+            if not isinstance(params, dict):
+                errors.append(f"{where}: 'params' must be an object")
+            elif len(type_errors) == 0:
+                errors.extend(_check_parameters(f"{where}.params", failure_model, Scenario.MICROSERVICE_TYPES, params))
+                if failure_model == "trace":
+                    if "trace" in params and not isinstance(params["trace"], str):
+                        errors.append(f"{where}.params: 'trace' must be the path of a trace directory")
+                    elif "trace" in params and not os.path.isfile(os.path.join(params["trace"], "index.json")):
+                        errors.append(f"{where}.params: trace directory '{params['trace']}' not found")
+                    if microservice.get("name") is None and params.get("key") is None:
+                        errors.append(f"{where}: a 'name' or params 'key' is needed to select the recorded lifetimes")
+                    if params.get("mode", "loop") not in ("loop", "once", "bootstrap"):
+                        errors.append(f"{where}.params: 'mode' must be 'loop', 'once' or 'bootstrap'")
+
+        provider = config.get("provider", {"type": "constant"})
+        if not isinstance(provider, dict):
+            errors.append("'provider' must be an object")
+        else:
+            type_errors = _check_type("provider", provider.get("type"), Scenario.PROVIDER_TYPES)
+            errors.extend(type_errors)
+            if len(type_errors) == 0:
+                errors.extend(_check_parameters("provider", provider["type"], Scenario.PROVIDER_TYPES,
+                                                {k: v for k, v in provider.items() if k != "type"}))
+            if provider.get("type") == "schedule":
+                for key in ("cost_of_failure_schedule", "spot_price_schedule"):
+                    if key in provider and not _is_schedule(provider[key]):
+                        errors.append(f"provider: '{key}' must be a list of [hour, value] pairs sorted by hour")
+            if "day_length" in provider and (not _is_number(provider["day_length"]) or provider["day_length"] <= 0):
+                errors.append("provider: 'day_length' must be a positive number")
+
+        orchestrator = config.get("orchestrator")
+        if not isinstance(orchestrator, dict):
+            errors.append("'orchestrator' must be an object")
+        else:
+            type_errors = _check_type("orchestrator", orchestrator.get("type"), Scenario.ORCHESTRATOR_TYPES)
+            errors.extend(type_errors)
+            if len(type_errors) == 0:
+                errors.extend(_check_parameters("orchestrator", orchestrator["type"], Scenario.ORCHESTRATOR_TYPES,
+                                                {k: v for k, v in orchestrator.items() if k not in ("type", "delta")}))
+            if not _is_number(orchestrator.get("delta")) or orchestrator["delta"] <= 0:
+                errors.append("orchestrator: 'delta' must be a positive number")
+            if orchestrator.get("time_budget") is not None and (not _is_number(orchestrator["time_budget"]) or orchestrator["time_budget"] <= 0):
+                errors.append("orchestrator: 'time_budget' must be a positive number")
+            if not isinstance(orchestrator.get("measure_unclaimed", False), bool):
+                errors.append("orchestrator: 'measure_unclaimed' must be true or false")
+
+        return errors
+
+    def build_cloud(self):
+        """
+            Creates the Cloud described by the scenario
+        """
+        Cloud = resolve("Cloud:Cloud", {})
+        microservices = []
+        for microservice in self.config["cloud"]:
+            cls = resolve(microservice.get("failure_model", "exponential"), Scenario.MICROSERVICE_TYPES)
+            microservices.append(cls(name=microservice.get("name"), num_containers=microservice.get("containers", 1),
+                                     cost=microservice["cost"], **microservice.get("params", {})))
+        return Cloud(microservices)
+
+    def build_provider(self):
+        """
+            Creates the SpotMarketProvider described by the scenario
+        """
+        params = dict(self.config.get("provider", {"type": "constant"}))
+        cls = resolve(params.pop("type"), Scenario.PROVIDER_TYPES)
+        return cls(**params)
+
+    def build_orchestrator(self, spot_market_provider):
+        """
+            Creates the orchestrator described by the scenario on the given spot market
+        """
+        params = dict(self.config["orchestrator"])
+        cls = resolve(params.pop("type"), Scenario.ORCHESTRATOR_TYPES)
+        return cls(orchestrator_delta=params.pop("delta"), spot_market_provider=spot_market_provider, **params)
+
+    def run(self, replica=0, trace=False):
+        """
+            Runs one replica of the scenario
+            Returns the finished simulator
+        """
+        from Experiment import spot_market_experiment
+        import numpy
+
+        if self.config["seed"] is not None:
+            random.seed(self.config["seed"] + replica)
+            numpy.random.seed(self.config["seed"] + replica)
+
+        cloud = self.build_cloud()
+        orchestrator = self.build_orchestrator(self.build_provider())
+        return spot_market_experiment(trace, cloud, orchestrator, sim_clock_step=self.sim_clock_step,
+                                      number_of_steps=self.number_of_steps, decimation=self.config["decimation"],
+                                      decimation_mode=self.config["decimation_mode"])
+
+    def __str__(self):
+        return f"{self.name}: {len(self.config['cloud'])} microservices, {self.number_of_steps} steps x {self.replicas} replicas"
+
+
+def _is_number(x):
+    return isinstance(x, (int, float)) and not isinstance(x, bool)
+
+
+def _is_schedule(schedule):
+    if not isinstance(schedule, list) or len(schedule) == 0:
+        return False
+    for step in schedule:
+        if not isinstance(step, list) or len(step) != 2 or not _is_number(step[0]) or not _is_number(step[1]):
+            return False
+    hours = [hour for hour, value in schedule]
+    return hours == sorted(hours)
+
+
+def _check_type(where, name, registry):
+    """
+        Checks that a type name is registered or refers to an importable module, without importing it
+    """
+    if not isinstance(name, str):
+        return [f"{where}: 'type' must be one of {', '.join(registry)} or 'module:Class'"]
+    reference = registry.get(name, name)
+    module_name, _, class_name = reference.partition(":")
+    if class_name == "":
+        return [f"{where}: unknown type '{name}' (expected one of {', '.join(registry)} or 'module:Class')"]
+    if importlib.util.find_spec(module_name) is None:
+        return [f"{where}: module '{module_name}' not found"]
+    return []
+
+
+def _check_parameters(where, name, registry, params):
+    """
+        Checks the keyword arguments given to a registered type against Scenario.PARAMETERS
+    """
+    allowed, required = Scenario.PARAMETERS.get(registry.get(name, name), (None, set()))
+    errors = [f"{where}: missing key '{key}'" for key in sorted(required - set(params))]
+    if allowed is not None:
+        errors.extend(f"{where}: unknown key '{key}'" for key in sorted(set(params) - allowed))
+    return errors
+
+
+def resolve(name, registry):
+    """
+        Imports the class registered under name, or named by a 'module:Class' reference
+    """
+    module_name, _, class_name = registry.get(name, name).partition(":")
+    return getattr(importlib.import_module(module_name), class_name)
@@ -0,0 +1,137 @@
+import argparse
+import copy
+import json
+import math
+import statistics
+import sys
+import time
+
+from Scenario import Scenario
+from SpotMarketProvider import SpotMarketProvider
+from Sweep import Sweep, ResultCache
+
+
+class SuccessiveHalving:
+    """
+        Searches the cells of a Sweep for the cheapest configurations by successive halving
+
+        Every candidate is first simulated at low fidelity (a coarser sim_clock_step, fewer replicas and a shorter
+        horizon). After each rung only the best 1/eta of the candidates are promoted to the next, eta times higher,
+        fidelity, until the survivors are simulated at the full fidelity of the sweep's scenario.
+        The simulated day of the spot market providers that take a day_length is shortened with the horizon, so that
+        every rung sees the provider's whole schedule rather than the start of its day.
+        Candidates are ranked by their mean total cost (running cost + actual cost of failure) per simulated second.
+    """
+
+    def __init__(self, sweep, eta=3, min_horizon_fraction=0.25, max_step_scale=4):
+        """
+            Creates a new search
+            sweep - the Sweep whose cells are the candidates
+            eta - the factor by which the candidates are reduced (and the fidelity increased) at each rung
+            min_horizon_fraction - the shortest horizon used, as a fraction of the scenario's horizon
+            max_step_scale - the largest factor by which sim_clock_step is coarsened
+        """
+        if eta < 2:
+            raise ValueError("eta must be at least 2")
+        self._sweep = sweep
+        self._eta = eta
+        self._min_horizon_fraction = min_horizon_fraction
+        self._max_step_scale = max_step_scale
+        self.rungs = []  # (fidelity, reduced scenario of the first candidate, number of candidates, simulated runs)
+        self._costs = {}  # Scenario config key => cost, since the clamped fidelities of early rungs can coincide
+
+    def at_fidelity(self, scenario, fidelity):
+        """
+            Returns a copy of the scenario reduced to the given fidelity (0, 1]
+        """
+        config = copy.deepcopy(scenario.config)
+        horizon_scale = max(fidelity, self._min_horizon_fraction)
+        config["sim_clock_step"] *= min(1 / fidelity, self._max_step_scale)
+        # At least one step is simulated
+        config["horizon"] = max(config["horizon"] * horizon_scale, config["sim_clock_step"])
+        config["replicas"] = max(1, round(config["replicas"] * fidelity))
+
+        provider = config.setdefault("provider", {"type": "constant"})
+        allowed, required = Scenario.PARAMETERS.get(Scenario.PROVIDER_TYPES.get(provider["type"], provider["type"]), (set(), set()))
+        if horizon_scale < 1 and "day_length" in allowed:
+            provider["day_length"] = provider.get("day_length", SpotMarketProvider.DAY_LENGTH) * horizon_scale
+        return Scenario(config)
+
+    def evaluate(self, scenario):
+        """
+            Returns the mean total cost per simulated second of the scenario's replicas
+        """
+        key = ResultCache.key(scenario.config)
+        if key not in self._costs:
+            costs = []
+            for replica in range(scenario.replicas):
+                result = self._sweep.run_cell(scenario, replica)
+                costs.append(float(result["RunningCost"]) + float(result["ActualCostOfFailure"]))
+            self._costs[key] = statistics.mean(costs) / (scenario.number_of_steps * scenario.sim_clock_step)
+        return self._costs[key]
+
+    def run(self, top=1):
+        """
+            Runs the search
+            Returns the best top (parameters, full-fidelity scenario, cost per second), cheapest first
+        """
+        candidates = list(self._sweep.cells())
+        number_of_rungs = max(1, math.ceil(math.log(max(1, len(candidates) / max(1, top)), self._eta)) + 1)
+
+        self.rungs = []
+        for rung in range(number_of_rungs):
+            fidelity = self._eta ** (rung - (number_of_rungs - 1))
+            simulated_before = self._sweep.simulated
+
+            ranked = []
+            for parameters, scenario in candidates:
+                ranked.append((self.evaluate(self.at_fidelity(scenario, fidelity)), parameters, scenario))
+            ranked.sort(key=lambda candidate: candidate[0])
+
+            reduced = self.at_fidelity(candidates[0][1], fidelity)
+            self.rungs.append((fidelity, reduced, len(candidates), self._sweep.simulated - simulated_before))
+
+            if rung == number_of_rungs - 1:
+                return [(parameters, scenario, cost) for cost, parameters, scenario in ranked[:top]]
+            survivors = max(top, math.ceil(len(candidates) / self._eta))
+            candidates = [(parameters, scenario) for cost, parameters, scenario in ranked[:survivors]]
+
+        return []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Finds the cheapest cells of a sweep by multi-fidelity successive halving")
+    parser.add_argument("sweep", help="sweep JSON file (see Sweep.py)")
+    parser.add_argument("--eta", type=int, default=3, help="reduction factor between rungs")
+    parser.add_argument("--top", type=int, default=3, help="number of configurations to report")
+    parser.add_argument("--min-horizon-fraction", type=float, default=0.25, help="shortest horizon, as a fraction of the scenario's")
+    parser.add_argument("--max-step-scale", type=float, default=4, help="largest factor by which sim_clock_step is coarsened")
+    parser.add_argument("-c", "--cache", default=".sweep_cache", help="result cache directory")
+    parser.add_argument("--no-cache", action="store_true", help="simulate every run")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    cache = None if args.no_cache else ResultCache(args.cache)
+    sweep = Sweep.from_file(args.sweep, cache=cache)
+    errors = sweep.validate()
+    for error in errors:
+        print(error, file=sys.stderr)
+    if len(errors) > 0:
+        return 1
+
+    search = SuccessiveHalving(sweep, eta=args.eta, min_horizon_fraction=args.min_horizon_fraction, max_step_scale=args.max_step_scale)
+    start = time.perf_counter()
+    best = search.run(top=args.top)
+    elapsed = time.perf_counter() - start
+
+    for fidelity, reduced, candidates, simulated in search.rungs:
+        print(f"Rung fidelity={fidelity:.3g}: {candidates} candidates at sim_clock_step={reduced.sim_clock_step:.3g}, "
+              f"{reduced.number_of_steps} steps x {reduced.replicas} replicas ({simulated} simulated)")
+    print(f"Search finished in {elapsed:.2f}s")
+
+    for rank, (parameters, scenario, cost) in enumerate(best):
+        print(f"#{rank + 1} {json.dumps(parameters)} >> Cost per second at full fidelity: {cost}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
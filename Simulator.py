@@ -1,19 +1,24 @@
 import math
 
 from MicroserviceContainer import *
-import random
-import numpy
+from EventLog import EventLog
+from TimeSeries import TimeSeries
 
 
 class Simulator:
-    def __init__(self, orchestrator, cloud, sim_clock_step=0.01, orchestrator_run_period=0.01, trace=False):
+    def __init__(self, orchestrator, cloud, sim_clock_step=0.01, orchestrator_run_period=0.01, trace=False, event_log_capacity=1 << 18,
+                 number_of_steps=None, decimation=1, decimation_mode=TimeSeries.SAMPLE):
         """
             Creates a new simulation
             orchestrator: the Orchestrator object
             cloud: a Cloud object
             sim_clock_step: by how much the simulation clock increments each iteration
             orchestrator_run_period: how often to run the orchestrator
-            trace: whether to print debug messages
+            trace: whether to record events to the event log (print them with EventLog.TracePrinter)
+            event_log_capacity: how many events the event log retains before overwriting the oldest
+            number_of_steps: the number of iterations that will be run, used to preallocate the outputs
+            decimation: the number of steps represented by each value of the per-step outputs
+            decimation_mode: TimeSeries.SAMPLE to keep every decimation-th step, TimeSeries.WINDOW to keep min/max/mean per window
         """
 
         # Simulation parameters
@@ -24,10 +29,15 @@ class Simulator:
         self._time_since_orchestrator = math.inf
         self._orchestrator_run_period = orchestrator_run_period
         self.orchestrator._trace = self._trace = trace
+        self.event_log = None
+        if trace:
+            self.event_log = EventLog(capacity=event_log_capacity)
+            self.event_log.declare_cloud(cloud)
+        self.orchestrator._event_log = self.event_log
 
         # Outputs
-        self._task_failure_probability = [] # Probability of task failing in the given interval [index * sim_clock_step, index * sim_clock_step + sim_clock_step]
-        self._expected_costs_of_failure = [] # Expected cost of failure in the given interval [index * sim_clock_step, index * sim_clock_step + sim_clock_step]
+        self._task_failure_probability = TimeSeries(number_of_steps, decimation, decimation_mode) # Probability of task failing in the given interval [step * sim_clock_step, step * sim_clock_step + sim_clock_step]
+        self._expected_costs_of_failure = TimeSeries(number_of_steps, decimation, decimation_mode) # Expected cost of failure in the given interval [step * sim_clock_step, step * sim_clock_step + sim_clock_step]
         self._failed_containers = [] # Tuples of (local time of failure, MicroserviceContainer)
         self._actual_cost_of_failures = 0 # The cumulative cost of failures defined as the cost of failure per second times the number of seconds the system failed
         self._running_cost = 0 # The cumulative cost of the microservices running
@@ -44,25 +54,34 @@ class Simulator:
             self._time_since_orchestrator = 0
 
         # Probabilistically update the failure or acceptance state of each container
-        for microservice in self.cloud.microservices:
+        running_cost_before = self._running_cost
+        for m, microservice in enumerate(self.cloud.microservices):
             for container in microservice.containers:
                 if container.state == MicroserviceContainer.STATE_ACTIVE:
                     # If the container has failed, we do not ever change its state again
                     # This container has not failed, so see if it is scheduled to fail this interval
                     if container.global_to_local_time(self._t) + self._sim_clock_step >= container.local_failure_time:
-                        container.state = MicroserviceContainer.STATE_FAILED
+                        microservice.fail_container(container)
                         self._failed_containers.append(container.local_failure_time)
-                        self.print_trace(f"Container {container.name} failed at local time {container.local_failure_time:.2f}.")
+                        if self._trace:
+                            self.event_log.record(EventLog.FAIL, self._t, m, container.name, container.local_failure_time)
 
                     # Update the running cost of the container
                     self._running_cost += microservice.cost * self._sim_clock_step
 
-        if self.cloud.probability_of_failure(self._t, self._sim_clock_step) >= 1:
+        step_failure_cost = 0
+        task_failure_probability = self.cloud.probability_of_failure(self._t, self._sim_clock_step)
+        if task_failure_probability >= 1:
             # The cloud has failed in this iteration
-            self._actual_cost_of_failures += self.orchestrator._cost_of_failure * self._sim_clock_step
+            step_failure_cost = self.orchestrator._cost_of_failure * self._sim_clock_step
+            self._actual_cost_of_failures += step_failure_cost
+
+        if self._trace:
+            self.event_log.add_cost(EventLog.COST_RUNNING, self._running_cost - running_cost_before)
+            self.event_log.add_cost(EventLog.COST_FAILURE, step_failure_cost)
 
         # Update the outputs
-        self._task_failure_probability.append(self.cloud.probability_of_failure(self._t, self._sim_clock_step))
+        self._task_failure_probability.append(task_failure_probability)
         self._expected_costs_of_failure.append(self.orchestrator.expected_cost_of_failure(self._t, self._sim_clock_step, self.cloud))
 
         # Update the clock
@@ -77,7 +96,3 @@ class Simulator:
             for container in microservice.containers:
                 if container.state == MicroserviceContainer.STATE_ACTIVE:
                     self._failed_containers.append(container.local_failure_time)
-
-    def print_trace(self, msg):
-        if self._trace:
-            print("[SIM] " + msg)
\ No newline at end of file
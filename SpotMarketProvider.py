@@ -1,4 +1,9 @@
+import bisect
+
+
 class SpotMarketProvider:
+    DAY_LENGTH = 5 # The default number of seconds of global time in a simulated day
+
     def __init__(self):
         pass
 
@@ -24,3 +29,75 @@ class SpotMarketProvider:
         Returns the spot price of running for a single time quantum
         """
         return self._spot_price_per_second(t) * delta
+
+
+class ScheduledSpotMarketProvider(SpotMarketProvider):
+    """
+        A spot market whose prices follow a daily schedule of (starting hour, value per second) steps
+    """
+
+    def __init__(self, cost_of_failure_schedule=((0, 1),), spot_price_schedule=((0, 1),), day_length=SpotMarketProvider.DAY_LENGTH):
+        """
+            Creates a new scheduled spot market
+            cost_of_failure_schedule - (hour, cost of failure per second) pairs sorted by hour
+            spot_price_schedule - (hour, spot price per second) pairs sorted by hour
+            day_length - the number of seconds of global time in a simulated day
+        """
+        super().__init__()
+        self._cost_of_failure_hours = [hour for hour, value in cost_of_failure_schedule]
+        self._cost_of_failure_values = [value for hour, value in cost_of_failure_schedule]
+        self._spot_price_hours = [hour for hour, value in spot_price_schedule]
+        self._spot_price_values = [value for hour, value in spot_price_schedule]
+        self._day_length = day_length
+
+    def _hour(self, t):
+        return 24 * (t % self._day_length) / self._day_length
+
+    @staticmethod
+    def _lookup(hours, values, hour):
+        # Before the first step of the schedule the last value of the previous day applies
+        return values[bisect.bisect_right(hours, hour) - 1]
+
+    def _cost_of_failure_per_second(self, t):
+        return self._lookup(self._cost_of_failure_hours, self._cost_of_failure_values, self._hour(t))
+
+    def _spot_price_per_second(self, t):
+        return self._lookup(self._spot_price_hours, self._spot_price_values, self._hour(t))
+
+
+class SharedSpotMarketProvider(SpotMarketProvider):
+    """
+        Wraps a SpotMarketProvider shared by many orchestrators so that each price is evaluated once per step
+        advance() must be called every step to discard the previous step's prices
+    """
+
+    def __init__(self, spot_market_provider):
+        super().__init__()
+        self._spot_market_provider = spot_market_provider
+        self._spot_prices = {}
+        self._costs_of_failure = {}
+
+    def advance(self):
+        """
+            Discards the cached prices
+        """
+        self._spot_prices.clear()
+        self._costs_of_failure.clear()
+
+    def _cost_of_failure_per_second(self, t):
+        return self._spot_market_provider._cost_of_failure_per_second(t)
+
+    def _spot_price_per_second(self, t):
+        return self._spot_market_provider._spot_price_per_second(t)
+
+    def cost_of_failure(self, t, delta):
+        cost = self._costs_of_failure.get((t, delta))
+        if cost is None:
+            cost = self._costs_of_failure[(t, delta)] = self._spot_market_provider.cost_of_failure(t, delta)
+        return cost
+
+    def spot_price(self, t, delta):
+        price = self._spot_prices.get((t, delta))
+        if price is None:
+            price = self._spot_prices[(t, delta)] = self._spot_market_provider.spot_price(t, delta)
+        return price
@@ -0,0 +1,338 @@
+import argparse
+import collections
+import copy
+import csv
+import hashlib
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+from Scenario import Scenario
+
+
+# The modules that determine the results of a scenario (the CLIs and services built on them do not)
+SIMULATION_MODULES = ["Cloud.py", "Experiment.py", "FailureTrace.py", "Microservice.py", "MicroserviceContainer.py",
+                      "Orchestrator.py", "Scenario.py", "Simulator.py", "SpotMarketProvider.py", "TimeSeries.py"]
+
+
+def code_version(directory=None):
+    """
+        Returns a hash of the simulation modules, so that cached results are invalidated when the simulation changes
+    """
+    if directory is None:
+        directory = os.path.dirname(os.path.abspath(__file__))
+
+    h = hashlib.sha256()
+    for file_name in SIMULATION_MODULES:
+        h.update(file_name.encode())
+        with open(os.path.join(directory, file_name), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+class ResultCache:
+    """
+        An on-disk, content-addressed cache of simulation results
+        Entries are compressed .npz files named by the hash of everything that determines the result. Once the cache
+        grows beyond max_bytes, the least recently used entries are evicted until it is back under low_water of max_bytes.
+        The entries are indexed in memory when the cache is opened; entries written by other processes since are not
+        evicted by this one.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30, low_water=0.9):
+        """
+            Creates a new cache
+            directory - where to store the results, created if it does not exist
+            max_bytes - the size above which the least recently used results are evicted
+            low_water - the fraction of max_bytes the cache is reduced to when it is evicted
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._low_water = low_water
+        os.makedirs(directory, exist_ok=True)
+
+        # Path => size, least recently used first
+        self._index = collections.OrderedDict()
+        for path, used, size in sorted(self._entries(), key=lambda entry: entry[1]):
+            self._index[path] = size
+        self.size = sum(self._index.values())
+        self.hits = 0
+        self.misses = 0
+        if self.size > self._max_bytes:
+            self.evict()
+
+    @staticmethod
+    def key(*parts):
+        """
+            Returns the cache key of the JSON-serialisable parts
+        """
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self._directory, key[:2], key + ".npz")
+
+    def _entries(self):
+        for root, dirs, files in os.walk(self._directory):
+            for file_name in files:
+                if file_name.endswith(".npz"):
+                    path = os.path.join(root, file_name)
+                    stat = os.stat(path)
+                    yield path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        """
+            Returns the result stored under key as a dict of arrays, or None if it is not cached
+        """
+        import numpy
+
+        path = self._path(key)
+        try:
+            with numpy.load(path) as data:
+                result = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            # A truncated or corrupt entry (e.g. zipfile.BadZipFile) is a miss, and is removed so that it is rewritten
+            self.misses += 1
+            self._remove(path)
+            return None
+
+        # Mark the entry as recently used
+        os.utime(path)
+        if path in self._index:
+            self._index.move_to_end(path)
+        else:
+            self._index[path] = os.path.getsize(path)
+            self.size += self._index[path]
+        self.hits += 1
+        return result
+
+    def _remove(self, path):
+        self.size -= self._index.pop(path, 0)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def put(self, key, result):
+        """
+            Stores a dict of arrays (or scalars) under key
+        """
+        import numpy
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so that concurrent sweeps never read a partial result
+        fd, temporary_path = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            numpy.savez_compressed(f, **result)
+        os.replace(temporary_path, path)
+
+        self.size -= self._index.pop(path, 0)
+        self._index[path] = os.path.getsize(path)
+        self.size += self._index[path]
+        if self.size > self._max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+            Removes the least recently used entries until the cache fits in low_water of max_bytes
+        """
+        while len(self._index) > 0 and self.size > self._low_water * self._max_bytes:
+            path = next(iter(self._index))
+            self._remove(path)
+
+
+class Sweep:
+    """
+        Runs a scenario over the cartesian product of parameter values, reusing cached results
+
+        The grid maps dotted paths into the scenario to lists of values, for example
+        {"orchestrator.delta": [0.01, 0.1], "provider.type": ["SpotMarketProvider1", "SpotMarketProvider2"],
+         "cloud.0.cost": [0.03, 0.05], "seed": [0, 1]}
+    """
+
+    def __init__(self, scenario, grid, cache=None, version=None):
+        """
+            Creates a new sweep
+            scenario - the Scenario (or scenario config) the grid is applied to
+            grid - dotted path => list of values
+            cache - the ResultCache to use, if any
+            version - the code version included in the cache keys, defaults to code_version()
+        """
+        if isinstance(scenario, Scenario):
+            scenario = scenario.config
+        self._config = scenario
+        self._grid = grid
+        self._cache = cache
+        self._version = version if version is not None else code_version()
+        self.simulated = 0
+
+    @classmethod
+    def from_file(cls, path, cache=None):
+        """
+            Loads a sweep from a JSON file of the form {"scenario": {...} or "scenario.json", "grid": {"path": [values]}}
+            A scenario file name is relative to the sweep file
+        """
+        with open(path) as f:
+            definition = json.load(f)
+        scenario = definition["scenario"]
+        if isinstance(scenario, str):
+            scenario = Scenario.from_file(os.path.join(os.path.dirname(path), scenario))
+        return cls(scenario, definition.get("grid", {}), cache=cache)
+
+    @property
+    def parameters(self):
+        """
+            Returns the dotted paths varied by the sweep
+        """
+        return list(self._grid)
+
+    def cells(self):
+        """
+            Yields (parameters, scenario) for every cell of the grid
+        """
+        paths = list(self._grid)
+        for values in itertools.product(*(self._grid[path] for path in paths)):
+            config = copy.deepcopy(self._config)
+            for path, value in zip(paths, values):
+                _set_path(config, path, value)
+            if config.get("seed") is None:
+                # Results are only reproducible, and so cacheable, with a seed
+                config["seed"] = 0
+            yield dict(zip(paths, values)), Scenario(config)
+
+    def validate(self):
+        """
+            Returns the error messages of every invalid cell
+        """
+        if not isinstance(self._config, dict):
+            return Scenario(self._config).validate()
+        errors = []
+        for parameters, scenario in self.cells():
+            errors.extend(f"{parameters}: {error}" for error in scenario.validate())
+        return errors
+
+    def cell_key(self, scenario, replica):
+        """
+            Returns the cache key of one replica of a cell
+            Replicas are keyed by their effective seed, so seed 0 replica 1 and seed 1 replica 0 share a result
+            Recorded failure traces are keyed by their fingerprint, so results are invalidated when a trace is rebuilt
+        """
+        config = {k: v for k, v in scenario.config.items() if k not in ("name", "replicas", "seed")}
+        traces = [microservice["params"]["trace"] for microservice in config["cloud"] if microservice.get("failure_model") == "trace"]
+        if len(traces) == 0:
+            return ResultCache.key(config, scenario.config["seed"] + replica, self._version)
+
+        from FailureTrace import FailureTrace
+        fingerprints = [FailureTrace.fingerprint(trace) for trace in traces]
+        return ResultCache.key(config, scenario.config["seed"] + replica, self._version, fingerprints)
+
+    @staticmethod
+    def cacheable(scenario):
+        """
+            Returns whether the results of the scenario are determined by its config and seed
+            An orchestrator in anytime mode (with a time_budget) decides depending on the wall clock, so its results are
+            never cached
+        """
+        return scenario.config["orchestrator"].get("time_budget") is None
+
+    def run_cell(self, scenario, replica):
+        """
+            Returns the results of one replica of a cell, simulating it only if it is not cached
+        """
+        cache = self._cache if Sweep.cacheable(scenario) else None
+        if cache is not None:
+            key = self.cell_key(scenario, replica)
+            result = cache.get(key)
+            if result is not None:
+                return result
+
+        simulator = scenario.run(replica=replica)
+        self.simulated += 1
+        result = {
+            "RunningCost": simulator._running_cost,
+            "ActualCostOfFailure": simulator._actual_cost_of_failures,
+            "ContainerFailureTimes": simulator._failed_containers,
+        }
+        for label, series in simulator.series.items():
+            result[label] = series.values
+
+        if cache is not None:
+            cache.put(key, result)
+        return result
+
+    def run(self):
+        """
+            Yields (parameters, replica, result) for every replica of every cell
+        """
+        for parameters, scenario in self.cells():
+            for replica in range(scenario.replicas):
+                yield parameters, replica, self.run_cell(scenario, replica)
+
+
+def _set_path(config, path, value):
+    keys = path.split(".")
+    target = config
+    for key in keys[:-1]:
+        if isinstance(target, list):
+            key = int(key)
+        elif key not in target:
+            target[key] = {}
+        target = target[key]
+    target[int(keys[-1]) if isinstance(target, list) else keys[-1]] = value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs a parameter sweep over a scenario, reusing cached results")
+    parser.add_argument("sweep", help='JSON file of the form {"scenario": {...} or "scenario.json", "grid": {"path": [values]}}')
+    parser.add_argument("-o", "--output", help="CSV file to write the per-replica results to")
+    parser.add_argument("-c", "--cache", default=".sweep_cache", help="result cache directory")
+    parser.add_argument("--max-cache-bytes", type=int, default=1 << 30, help="cache size above which old results are evicted")
+    parser.add_argument("--no-cache", action="store_true", help="simulate every cell")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only validate the sweep")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    cache = None if args.no_cache else ResultCache(args.cache, max_bytes=args.max_cache_bytes)
+    sweep = Sweep.from_file(args.sweep, cache=cache)
+
+    errors = sweep.validate()
+    for error in errors:
+        print(error, file=sys.stderr)
+    if len(errors) > 0:
+        return 1
+    if args.dry_run:
+        print(f"OK {sum(1 for cell in sweep.cells())} cells")
+        return 0
+
+    output_file = writer = None
+    if args.output is not None:
+        output_file = open(args.output, "w", newline="")
+        writer = csv.writer(output_file)
+        writer.writerow(sweep.parameters + ["Replica", "RunningCost", "ActualCostOfFailure", "TotalCost"])
+
+    start = time.perf_counter()
+    runs = 0
+    try:
+        for parameters, replica, result in sweep.run():
+            runs += 1
+            if writer is not None:
+                running_cost = float(result["RunningCost"])
+                actual_cost_of_failure = float(result["ActualCostOfFailure"])
+                writer.writerow(list(parameters.values()) + [replica, running_cost, actual_cost_of_failure,
+                                                             running_cost + actual_cost_of_failure])
+    finally:
+        if output_file is not None:
+            output_file.close()
+
+    print(f"Runs: {runs} (simulated: {sweep.simulated}, cached: {runs - sweep.simulated}) in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
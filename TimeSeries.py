@@ -0,0 +1,136 @@
+import math
+import numpy
+
+
+class TimeSeries:
+    """
+        A per-step simulation output stored in a preallocated NumPy buffer
+        Either every k-th step is kept (SAMPLE), or the min/max/mean of every window of k steps (WINDOW)
+    """
+    SAMPLE = "sample"
+    WINDOW = "window"
+
+    def __init__(self, number_of_steps=None, decimation=1, mode=SAMPLE, dtype=numpy.float64):
+        """
+            Creates a new time series
+            number_of_steps - the number of steps that will be appended, used to size the buffers
+                              (the buffers grow geometrically if it is not known or exceeded)
+            decimation - the number of steps represented by each stored value (k)
+            mode - TimeSeries.SAMPLE or TimeSeries.WINDOW
+            dtype - the type of the stored values (the window means are always float64)
+        """
+        if decimation < 1:
+            raise ValueError("decimation must be at least 1")
+        if mode not in (TimeSeries.SAMPLE, TimeSeries.WINDOW):
+            raise ValueError(f"unknown decimation mode '{mode}'")
+
+        self.decimation = decimation
+        self.mode = mode
+        capacity = 64 if number_of_steps is None else max(1, math.ceil(number_of_steps / decimation))
+
+        self._steps = 0  # Number of values appended
+        self._length = 0  # Number of values stored
+        if mode == TimeSeries.SAMPLE:
+            self._values = numpy.empty(capacity, dtype=dtype)
+        else:
+            self._min = numpy.empty(capacity, dtype=dtype)
+            self._max = numpy.empty(capacity, dtype=dtype)
+            self._mean = numpy.empty(capacity, dtype=numpy.float64)
+
+            # The window currently being accumulated
+            self._window_min = self._window_max = None
+            self._window_sum = 0
+            self._window_count = 0
+
+    def _grow(self):
+        if self.mode == TimeSeries.SAMPLE:
+            self._values = numpy.resize(self._values, 2 * len(self._values))
+        else:
+            self._min = numpy.resize(self._min, 2 * len(self._min))
+            self._max = numpy.resize(self._max, 2 * len(self._max))
+            self._mean = numpy.resize(self._mean, 2 * len(self._mean))
+
+    def append(self, value):
+        """
+            Adds the value of the next step
+        """
+        if self.mode == TimeSeries.SAMPLE:
+            if self._steps % self.decimation == 0:
+                if self._length == len(self._values):
+                    self._grow()
+                self._values[self._length] = value
+                self._length += 1
+        else:
+            if self._window_count == 0:
+                self._window_min = self._window_max = value
+            else:
+                if value < self._window_min:
+                    self._window_min = value
+                if value > self._window_max:
+                    self._window_max = value
+            self._window_sum += value
+            self._window_count += 1
+
+            if self._window_count == self.decimation:
+                if self._length == len(self._mean):
+                    self._grow()
+                self._min[self._length] = self._window_min
+                self._max[self._length] = self._window_max
+                self._mean[self._length] = self._window_sum / self._window_count
+                self._length += 1
+                self._window_sum = 0
+                self._window_count = 0
+        self._steps += 1
+
+    def _with_partial_window(self, values, partial):
+        if self._window_count == 0:
+            return values[:self._length]
+        return numpy.append(values[:self._length], partial)
+
+    @property
+    def values(self):
+        """
+            Returns the stored values (the window means in WINDOW mode)
+        """
+        return self.mean
+
+    @property
+    def min(self):
+        if self.mode == TimeSeries.SAMPLE:
+            return self._values[:self._length]
+        return self._with_partial_window(self._min, self._window_min)
+
+    @property
+    def max(self):
+        if self.mode == TimeSeries.SAMPLE:
+            return self._values[:self._length]
+        return self._with_partial_window(self._max, self._window_max)
+
+    @property
+    def mean(self):
+        if self.mode == TimeSeries.SAMPLE:
+            return self._values[:self._length]
+        return self._with_partial_window(self._mean, self._window_sum / max(1, self._window_count))
+
+    def steps(self):
+        """
+            Returns the index of the first step represented by each stored value
+        """
+        return numpy.arange(len(self)) * self.decimation
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __len__(self):
+        if self.mode == TimeSeries.SAMPLE or self._window_count == 0:
+            return self._length
+        return self._length + 1
+
+    @property
+    def nbytes(self):
+        """
+            Returns the memory used by the buffers
+        """
+        if self.mode == TimeSeries.SAMPLE:
+            return self._values.nbytes
+        return self._min.nbytes + self._max.nbytes + self._mean.nbytes
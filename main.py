@@ -1,147 +1,107 @@
-import math
+import argparse
 import statistics
 import sys
-import numpy
-import copy
 
-from Orchestrator import *
-from Cloud import *
-from Microservice import *
-from MicroserviceContainer import *
-from Simulator import *
-from SpotMarketProvider import *
+from Scenario import Scenario
 
 
-class ExponentialMicroservice(Microservice):
-    def _select_random_failure_time(self):
-        # Exponential distribution does not require t
-        return numpy.random.exponential(1, 1)[0]
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Runs cloud reliability scenarios described by JSON files")
+    parser.add_argument("scenarios", nargs="+", help="scenario files, or directories of *.json scenario files")
+    parser.add_argument("-o", "--output", help="CSV file to write the per-replica results to")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only load and validate the scenarios")
+    parser.add_argument("-r", "--replicas", type=int, help="override the number of replicas of every scenario")
+    parser.add_argument("-t", "--trace", action="store_true", help="print the simulation trace and per-step results")
+    return parser.parse_args(argv)
 
-    def failure_function(self, t):
-        return 1 - math.pow(math.e, -t)
 
+def print_summary(label, values):
+    if len(values) > 1:
+        print(f"{label} >> Mean: {statistics.mean(values)} | Median: {statistics.median(values)} | Variance: {statistics.variance(values)}")
 
-class ExperimentalOrchestrator(Orchestrator):
+
+def run_scenario(scenario, replicas, trace, output_file):
     """
-        The orchestrator's policy is to maintain the reliability of the system above 90 percent
+        Runs every replica of a scenario, writing the results to output_file and printing summary statistics
     """
-
-    def __init__(self, orchestrator_delta, cost_of_failure=1):
-        """
-            Creates a new orchestrator on the given cloud
-            cloud - the cloud to orchestrate
-            delta - the period of time for which the orchestrator will ensure reliability
-            cost_of_failure - The cost of a failure
-        """
-        self.orchestrator_delta = orchestrator_delta
-        self._cost_of_failure = cost_of_failure
-
-    def orchestrate(self, cloud, t):
-        self.print_trace("Running orchestrator ...")
-        super().orchestrate(cloud, t)
-
-        while True:
-            # The reliability of the cloud has dropped below the threshold level
-            # Attempt to add redundant microservices
-            selected_microservice = self.select_microservice_for_redundancy(cloud, t, self.orchestrator_delta)
-            if selected_microservice is not None:
-                new_container = cloud.microservices[selected_microservice].spawn_container(t0=t)
-                self.print_trace(f"Spawned new redundant container {new_container}.")
-            else:
-                break
-
-
-class ControlOrchestrator(Orchestrator):
-    def __init__(self, orchestrator_delta, cost_of_failure=1):
-        """
-            Creates a new orchestrator on the given cloud
-            cloud - the cloud to orchestrate
-            delta - the period of time for which the orchestrator will ensure reliability
-            cost_of_failure - The cost of a failure
-        """
-        self.orchestrator_delta = orchestrator_delta
-        self._cost_of_failure = cost_of_failure
-
-    def orchestrate(self, cloud, t):
-        self.print_trace("Running orchestrator ...")
-        super().orchestrate(cloud, t)
-
-        for microservice in cloud.microservices:
-            while microservice.probability_of_failure(t, self.orchestrator_delta) >= 0.01:
-                # The reliability of the microservice has dropped below the threshold level
-                # Attempt to add redundant microservices
-                new_container = microservice.spawn_container(t0=t)
-                self.print_trace(f"Spawned new redundant container {new_container}.")
-
-
-class NOPOrchestrator(Orchestrator):
-    def expected_cost_of_failure(self, t, delta, cloud):
-        return 1
-
-    def orchestrate(self, cloud, t):
-        pass
-
-
-def run_experiment(trace):
-    cloud = Cloud([ExponentialMicroservice(num_containers=10, cost=5), ExponentialMicroservice(num_containers=10, cost=3)])
-    #simulator = Simulator(orchestrator=ExperimentalOrchestrator(orchestrator_delta=.01, cost_of_failure=1000), cloud=cloud, sim_clock_step=0.01,
-    #                      orchestrator_run_period=0.01, trace=trace)
-    simulator = SpotMarketSimulator(orchestrator=SpotMarketOrchestrator(orchestrator_delta=.01, spot_market_provider=SpotMarketProvider()), cloud=cloud, sim_clock_step=0.01,
-                         orchestrator_run_period=0.01, trace=trace)
-
-    for i in range(0, 500):
-        simulator.iterate()
-        p_failure = cloud.probability_of_failure(simulator._t, simulator._sim_clock_step)
-
-        if trace:
-            print(f"[{i}] (t={simulator._t:.2f}s): [P(failure)={p_failure}, FC={simulator.orchestrator._spot_market_provider._cost_of_failure_per_second(simulator._t)}] {str(cloud)}")
-
-    simulator.finalize()
-
-    return simulator
-
-
-def main():
-    output_file = None
-    if len(sys.argv) > 1:
-        output_file = open(sys.argv[1], "w")
-        output_file.write("Experiment,Parameter\n")
-
     container_failure_times = []
     running_costs = []
     actual_costs_of_failure = []
-    trace = True
-    num_experiments = 1
 
-    for x in range(num_experiments):
-        print(f"Experiment {x}")
-        simulator = run_experiment(trace)
+    for x in range(replicas):
+        print(f"Experiment {x} ({scenario.name})")
+        simulator = scenario.run(replica=x, trace=trace)
 
         # Prepare the output results
-        output_results = f"{x},TaskFailureProbability," + ",".join(str(sss) for sss in simulator._task_failure_probability)
-        output_results += f"\n{x},ExpectedCostOfFailure," + ",".join(str(sss) for sss in simulator._expected_costs_of_failure)
-        output_results += f"\n{x},RunningCost,{simulator._running_cost}"
-        output_results += f"\n{x},ActualCostOfFailure,{simulator._actual_cost_of_failures}"
+        output_results = f"{scenario.name},{x},TaskFailureProbability," + ",".join(str(p) for p in simulator._task_failure_probability.values.tolist())
+        output_results += f"\n{scenario.name},{x},ExpectedCostOfFailure," + ",".join(str(c) for c in simulator._expected_costs_of_failure.values.tolist())
+        output_results += f"\n{scenario.name},{x},RunningCost,{simulator._running_cost}"
+        output_results += f"\n{scenario.name},{x},ActualCostOfFailure,{simulator._actual_cost_of_failures}"
         output_results += "\n"
         if output_file is not None:
             output_file.write(output_results)
 
         if trace:
+            print("Final aggregated results:")
             print(output_results)
 
-        for res in simulator._failed_containers:
-            container_failure_times.append(res)
-
+        container_failure_times.extend(simulator._failed_containers)
         running_costs.append(simulator._running_cost)
         actual_costs_of_failure.append(simulator._actual_cost_of_failures)
 
-    print(f"Container Failure Times >> Mean: {statistics.mean(container_failure_times)} | Median: {statistics.median(container_failure_times)} | Variance: {statistics.variance(container_failure_times)}")
-    print(f"Running Cost >> Mean: {statistics.mean(running_costs)} | Median: {statistics.median(running_costs)} | Variance: {statistics.variance(running_costs)}")
-    print(f"Actual Cost of Failures >> Mean: {statistics.mean(actual_costs_of_failure)} | Median: {statistics.median(actual_costs_of_failure)} | Variance: {statistics.variance(actual_costs_of_failure)}")
-    if output_file is not None:
-        #output_file.write("\n".join([str(sss) for sss in results]))
-        output_file.close()
+        if getattr(simulator.orchestrator, "time_budget", None) is not None:
+            deadline = simulator.orchestrator.deadline_statistics()
+            print(f"Orchestrator deadline >> Hit: {deadline['deadline_hits']}/{deadline['runs']} runs | "
+                  f"p50: {deadline['p50_latency'] * 1000:.3f}ms | p99: {deadline['p99_latency'] * 1000:.3f}ms | "
+                  f"Unclaimed utility: {deadline['unclaimed_utility']}")
+
+    print_summary("Container Failure Times", container_failure_times)
+    print_summary("Running Cost", running_costs)
+    print_summary("Actual Cost of Failures", actual_costs_of_failure)
+    print_summary("Total Cost", [running_costs[i] + actual_costs_of_failure[i] for i in range(len(running_costs))])
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    try:
+        scenarios = Scenario.from_paths(args.scenarios)
+    except (OSError, ValueError) as e:
+        print(f"Could not load scenarios: {e}", file=sys.stderr)
+        return 2
+
+    if args.replicas is not None and args.replicas < 1:
+        print("--replicas must be a positive integer", file=sys.stderr)
+        return 2
+
+    valid = True
+    for scenario in scenarios:
+        for error in scenario.validate():
+            print(f"{scenario.path or scenario.name}: {error}", file=sys.stderr)
+            valid = False
+    if not valid:
+        return 1
+
+    if args.dry_run:
+        for scenario in scenarios:
+            print(f"OK {scenario}")
+        return 0
+
+    output_file = None
+    if args.output is not None:
+        output_file = open(args.output, "w")
+        output_file.write("Scenario,Experiment,Parameter\n")
+
+    try:
+        for scenario in scenarios:
+            replicas = args.replicas if args.replicas is not None else scenario.replicas
+            run_scenario(scenario, replicas, args.trace, output_file)
+    finally:
+        if output_file is not None:
+            output_file.close()
+
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+
+from DecisionService import DecisionService, generate_load
+
+
+def snapshot(request_id, cloud_id, ages, t=1.0):
+    containers = [{"name": f"{cloud_id}-{i}", "age": age} for i, age in enumerate(ages)]
+    return {"id": request_id, "cloud_id": cloud_id, "t": t,
+            "microservices": [{"name": "db", "cost": 0.05, "containers": containers}]}
+
+
+class DecideBatchTest(unittest.TestCase):
+    def test_decisions_keep_their_request_ids(self):
+        service = DecisionService()
+        responses = service.decide_batch([snapshot(1, "a", [0.4]), snapshot(2, "b", [0.4, 1.2])])
+        self.assertEqual([response["id"] for response in responses], [1, 2])
+        for response in responses:
+            self.assertNotIn("error", response)
+            self.assertIn("db", response["containers"])
+
+    def test_bad_snapshot_only_fails_its_own_request(self):
+        service = DecisionService()
+        # The exponential failure function rounds to 1 at this age, so the conditional probability is undefined
+        too_old = snapshot(2, "b", [40])
+        unnamed = snapshot(3, "c", [0.4])
+        del unnamed["microservices"][0]["containers"][0]["name"]
+
+        responses = service.decide_batch([snapshot(1, "a", [0.4]), too_old, unnamed, "not an object"])
+        self.assertNotIn("error", responses[0])
+        self.assertEqual(responses[1]["id"], 2)
+        self.assertIn("ZeroDivisionError", responses[1]["error"])
+        self.assertEqual(responses[2]["id"], 3)
+        self.assertIn("no name", responses[2]["error"])
+        self.assertIsNone(responses[3]["id"])
+
+    def test_identical_snapshots_are_decided_once(self):
+        service = DecisionService()
+        first, second = service.decide_batch([snapshot(1, "a", [0.4]), snapshot(2, "a", [0.4])])
+        self.assertEqual(dict(first, id=None), dict(second, id=None))
+
+    def test_spawns_are_counted_by_container(self):
+        service = DecisionService()
+        response = service.decide_batch([snapshot(1, "a", [])])[0]
+        # The microservice has no containers, so at least the recovery container is spawned
+        self.assertGreaterEqual(response["spawn"]["db"], 1)
+        self.assertEqual(response["spawn"]["db"] - len(response["remove"].get("db", [])), response["containers"]["db"])
+
+    def test_anytime_orchestrators_report_their_deadlines(self):
+        service = DecisionService()
+        request = snapshot(1, "a", [0.4, 1.2])
+        request["orchestrator"] = {"type": "spot_market", "delta": 0.01, "time_budget": 1}
+        response = service.decide_batch([request])[0]
+        self.assertFalse(response["deadline_hit"])
+        self.assertEqual(service.deadline_statistics()["a"]["runs"], 1)
+        self.assertNotIn("deadline_hit", service.decide_batch([snapshot(2, "b", [0.4])])[0])
+
+    def test_least_recently_used_clouds_are_evicted(self):
+        service = DecisionService(max_clouds=2)
+        service.decide_batch([snapshot(1, "a", [0.4]), snapshot(2, "b", [0.4])])
+        service.decide_batch([snapshot(3, "a", [0.4], t=2.0), snapshot(4, "c", [0.4])])
+        self.assertEqual(list(service._clouds), ["a", "c"])
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_generate_load_against_a_service_in_process(self):
+        async def round_trip():
+            service = DecisionService(max_batch=8)
+            server = await service.start(host="127.0.0.1", port=0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                latencies = await generate_load(lambda: asyncio.open_connection("127.0.0.1", port), clients=4,
+                                                requests_per_client=5, clouds=2)
+            finally:
+                server.close()
+                await server.wait_closed()
+                service._batcher_task.cancel()
+            return service, latencies
+
+        service, latencies = asyncio.run(round_trip())
+        self.assertEqual(len(latencies), 20)
+        self.assertEqual(service.requests, 20)
+        self.assertLessEqual(service.batches, 20)
+
+
+if __name__ == '__main__':
+    unittest.main()